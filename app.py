@@ -1,56 +1,520 @@
 import os
+import atexit
+import contextlib
 import datetime
+import functools
+import hashlib
+import hmac
+import itertools
 import uuid
-from flask import Flask, request, redirect, url_for, flash, get_flashed_messages, session, jsonify
-from tinydb import TinyDB, Query
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import zlib
+from flask import Flask, Response, request, redirect, url_for, flash, get_flashed_messages, session, jsonify, make_response, stream_with_context, g, has_request_context
+from markupsafe import escape
+from tinydb import TinyDB
+import click
+from storage import LogDB, MeteredJSONStorage, forget_next_ids
+from sqlite_store import SQLiteDB, migrate_json
+from indexes import IndexedTable
+from textindex import TextIndex, tokenize
+from chatbot import ChatBot
+from migrations import LATEST, migrate, stamp_version
+from archive import Archive
+from ical import FeedCache, render_feed
+from live import Broadcaster
+from stats import Stats
+from coordination import ChangeRecorder, ProcessLock
+from assets import assets, asset_urls, add_asset, pick_encoding, compress_body, ENCODINGS
+from writer import BatchWriter, Busy
+from passwords import HashPool, DEFAULT_METHOD
+from metrics import COUNT_BUCKETS, MeteredTable, RequestStats, record_time, registry, use_request_stats
+from bulk import EVENT_TYPES, FIELDS, FORMATS, REGISTRATION_EXPORT_FIELDS, RowError, clean_row, export_lines, format_for, read_rows
 
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_for_sessions_replace_in_production'
 
 
-db_path = 'db.json'
-db = TinyDB(db_path)
-clubs_table = db.table('clubs')
-events_table = db.table('events')
-users_table = db.table('users')
-registrations_table = db.table('registrations')
+storage_backend = os.environ.get('CLUBHUB_STORAGE', 'json')
+db_path = os.environ.get('CLUBHUB_DB', 'clubhub.sqlite3' if storage_backend == 'sqlite' else 'db.json')
+# 'json' rewrites the whole file on every write; 'log' appends each change and compacts in the background;
+# 'sqlite' keeps each table in SQLite with indexes on the fields the routes look up by
+def open_db(path):
+    if storage_backend == 'log':
+        store = LogDB(path, compact_bytes=int(os.environ.get('CLUBHUB_LOG_COMPACT_BYTES', 8 * 1024 * 1024)))
+        store.storage.process_lock = db_lock
+        atexit.register(store.close)
+        return store
+    if storage_backend == 'sqlite':
+        return SQLiteDB(path)
+    return TinyDB(path, storage=MeteredJSONStorage)
+
+
+def deferred_writes(store):
+    # the json backend rewrites the whole file per write, so a block of writes is saved once at its end;
+    # the log and sqlite backends write only what changed anyway
+    if storage_backend == 'json':
+        return store.storage.deferred()
+    return contextlib.nullcontext()
+
+
+def refresh_db(store):
+    # after another worker wrote: the log backend re-reads its log, and TinyDB forgets which doc ids are free
+    if storage_backend == 'log':
+        store.storage.refresh()
+    if storage_backend != 'sqlite':
+        forget_next_ids(store)
+
+
+# serialises writers, in this process and across worker processes sharing the database, and tells each
+# worker which documents the others changed (see coordination.py); apply_remote_changes is set below
+db_lock = ProcessLock(db_path)
+
+with db_lock:
+    # loaded under the lock, so no other worker is halfway through rewriting the files
+    db = open_db(db_path)
+    # MeteredTable counts what reaches storage; lookups answered by the indexes never do
+    clubs_table = IndexedTable(MeteredTable(db.table('clubs')), ['name'])
+    events_table = IndexedTable(MeteredTable(db.table('events')), ['id', 'club_name'], order_by='date', order_default='9999')
+    users_table = IndexedTable(MeteredTable(db.table('users')), ['username'])
+    registrations_table = IndexedTable(MeteredTable(db.table('registrations')), ['event_id', 'username'])
+    waitlist_table = IndexedTable(MeteredTable(db.table('waitlist')), ['event_id', 'username'])
+    meta_table = MeteredTable(db.table('meta'))
+live_tables = (clubs_table, events_table, users_table, registrations_table, waitlist_table)
+for table in live_tables:
+    table.watch(ChangeRecorder(db_lock, table.name), replay=False)
+
+# past events and their registrations move to a separate database, opened on first use
+archive_path = os.environ.get('CLUBHUB_ARCHIVE_DB') or '%s-archive%s' % os.path.splitext(db_path)
+archive = Archive(lambda: open_db(archive_path), db_lock, lambda table: [ChangeRecorder(db_lock, table.name)])
+ARCHIVE_AFTER_DAYS = int(os.environ.get('CLUBHUB_ARCHIVE_AFTER_DAYS', 90))
+
+
+# word indexes for the chat bot and search, kept current by the tables' own writes
+event_words = TextIndex(['title', 'description', 'type', 'location', 'club_name'], facets=['type', 'club_name'],
+                        weights={'title': 3, 'club_name': 2}, prefixes=True)
+club_text = TextIndex(['name', 'description', 'leader'], weights={'name': 3}, prefixes=True)
+club_words = TextIndex(['name'])
+events_table.watch(event_words)
+clubs_table.watch(club_text)
+clubs_table.watch(club_words)
+# counters behind /stats, built by replaying the tables and moved by every write after that
+stats = Stats()
+events_table.watch(stats.events_watcher())
+registrations_table.watch(stats.registrations_watcher())
+chat_bot = ChatBot(events_table, clubs_table, event_words, club_words)
+
+
+# rendered .ics feeds by ('user', username) / ('club', name); a write drops only the feeds it affects
+feed_cache = FeedCache()
+
+
+def event_feed_keys(e):
+    eid = e.get('id')
+    return [('club', e.get('club_name'))] + [('user', r['username']) for table in (registrations_table, waitlist_table)
+                                             for r in table.find(event_id=eid)]
+
+
+events_table.watch(feed_cache.watcher(event_feed_keys), replay=False)
+registrations_table.watch(feed_cache.watcher(lambda r: [('user', r.get('username'))]), replay=False)
+waitlist_table.watch(feed_cache.watcher(lambda r: [('user', r.get('username'))]), replay=False)
+clubs_table.watch(feed_cache.watcher(lambda c: [('club', c.get('name'))]), replay=False)
+
+# backfills run here, once per schema version, so no request ever has to check or write on a read
+with db_lock, deferred_writes(db):
+    migrate({table.name: table for table in live_tables}, meta_table)
+
+
+def rebuild_indexes():
+    for table in live_tables:
+        table.rebuild()
+
+
+# event_id -> number of registrations; kept in step by every write route so home() never counts
+participant_counts = {}
+
+
+# both read storage, so they hold db_lock: on the json backend a read shares the file handle the batch writer rewrites
+def rebuild_participant_counts():
+    with db_lock:
+        participant_counts.clear()
+        for r in registrations_table.all():
+            participant_counts[r['event_id']] = participant_counts.get(r['event_id'], 0) + 1
+
+
+def check_participant_counts():
+    actual = {}
+    with db_lock:
+        for r in registrations_table.all():
+            actual[r['event_id']] = actual.get(r['event_id'], 0) + 1
+    mismatches = {}
+    for eid in set(actual) | set(participant_counts):
+        if actual.get(eid, 0) != participant_counts.get(eid, 0):
+            mismatches[eid] = (participant_counts.get(eid, 0), actual.get(eid, 0))
+    return mismatches
+
+
+rebuild_participant_counts()
+
+# pushes participant counts to /live/counts listeners: registration writes mark the events whose count moved,
+# mark_changed() publishes them. While anyone listens, other workers' writes are picked up every CLUBHUB_LIVE_SYNC_MS.
+live_counts = Broadcaster(poll=db_lock.sync, poll_interval=int(os.environ.get('CLUBHUB_LIVE_SYNC_MS', 250)) / 1000)
+registrations_table.watch(live_counts.watcher(lambda r: r.get('event_id')), replay=False)
+
+
+# Every write route calls mark_changed(). data_version feeds the list-page ETags; card_versions retires
+# the cached markup of the cards a write touched. boot_id keeps ETags from a previous process from matching.
+boot_id = uuid.uuid4().hex
+data_version = 0
+card_versions = {}
+card_cache = {}
+
+
+def mark_changed(*cards, dropped=False):
+    global data_version
+    data_version += 1
+    for card in cards:
+        card_cache.pop(card, None)
+        if dropped:
+            card_versions.pop(card, None)
+        else:
+            card_versions[card] = card_versions.get(card, 0) + 1
+    live_counts.flush(lambda eid: participant_counts.get(eid, 0), lambda: dict(participant_counts))
+
+
+def reset_card_cache():
+    mark_changed()
+    card_cache.clear()
+    card_versions.clear()
+
+
+def apply_remote_changes(changes):
+    """Catch this worker's tables, counts and cached cards up with other workers' writes (see coordination.py)."""
+    refresh_db(db)
+    if archive.db is not None:
+        refresh_db(archive.db)
+    tables = {table.name: table for table in live_tables}
+    tables.update(archive.tables())
+    if changes is None:
+        changes = dict.fromkeys(tables)
+    cards, counted, reload_all = [], set(), False
+    for name, doc_ids in changes.items():
+        table = tables.get(name)
+        if table is None:
+            continue
+        if doc_ids is None:
+            table.rebuild()
+            reload_all = True
+            continue
+        old, new = table.refresh(doc_ids)
+        for doc in old + new:
+            if name == 'events':
+                cards.append(('event', doc.get('id')))
+            elif name == 'clubs':
+                cards.append(('club', doc.get('name')))
+            elif name in ('registrations', 'waitlist'):
+                cards.append(('event', doc.get('event_id')))
+                if name == 'registrations':
+                    counted.add(doc.get('event_id'))
+    if reload_all:
+        rebuild_participant_counts()
+        reset_card_cache()
+        return
+    for eid in counted:
+        n = registrations_table.count_of('event_id', eid)
+        if n:
+            participant_counts[eid] = n
+        else:
+            participant_counts.pop(eid, None)
+    mark_changed(*cards)
+
+
+db_lock.apply = apply_remote_changes
+
+
+def cached_card(card, build):
+    version = card_versions.get(card, 0)
+    hit = card_cache.get(card)
+    if hit is None or hit[0] != version:
+        hit = card_cache[card] = (version,) + build()
+    return hit[1:]
+
+
+def list_page_etag():
+    # pages carrying a flash message are one-offs, so they are never validated
+    if session.get('_flashes'):
+        return None
+    encoding = pick_encoding(request.accept_encodings, ENCODINGS)
+    raw = f"{boot_id}|{data_version}|{session.get('username')}|{session.get('role')}|{request.full_path}|{datetime.date.today()}|{encoding}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional_page(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = list_page_etag()
+        if etag and request.if_none_match.contains(etag):
+            resp = make_response('', 304)
+        else:
+            resp = make_response(view(*args, **kwargs))
+        if etag:
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            resp.vary.add('Cookie')
+        return resp
+    return wrapper
+
+
+def apply_registration_batch(ops):
+    """Apply queued ('register' | 'unregister', event_id, username) ops and return one result per op.
+
+    Decisions are made against the indexes plus this batch's own earlier decisions, then written
+    with one insert_multiple / remove per table.
+    """
+    with db_lock:
+        regs, waits, counts, wait_counts, joined = {}, {}, {}, {}, {}
+
+        def registered(eid, user):
+            key = (eid, user)
+            return regs[key] if key in regs else bool(registrations_table.find(event_id=eid, username=user))
+
+        def waiting(eid, user):
+            key = (eid, user)
+            return waits[key] if key in waits else bool(waitlist_table.find(event_id=eid, username=user))
+
+        def count(eid):
+            return counts.get(eid, participant_counts.get(eid, 0))
+
+        def wait_count(eid):
+            return wait_counts.get(eid, waitlist_table.count_of('event_id', eid))
+
+        def next_waiting(eid):
+            users = [w['username'] for w in waitlist_table.find(event_id=eid)] + joined.get(eid, [])
+            return next((u for u in users if waiting(eid, u)), None)
+
+        results = []
+        for op, eid, user in ops:
+            event = events_table.find_one(id=eid)
+            capacity = event.get('capacity') if event else None
+            if op == 'register':
+                if not event:
+                    results.append('missing')
+                elif registered(eid, user):
+                    results.append('registered')
+                elif waiting(eid, user):
+                    results.append('waitlisted')
+                elif capacity is None or count(eid) < capacity:
+                    regs[(eid, user)] = True
+                    counts[eid] = count(eid) + 1
+                    results.append('registered')
+                elif wait_count(eid) < event.get('waitlist', 0):
+                    waits[(eid, user)] = True
+                    wait_counts[eid] = wait_count(eid) + 1
+                    joined.setdefault(eid, []).append(user)
+                    results.append('waitlisted')
+                else:
+                    results.append('full')
+            elif registered(eid, user):
+                regs[(eid, user)] = False
+                counts[eid] = count(eid) - 1
+                promoted = next_waiting(eid) if capacity is not None and count(eid) < capacity else None
+                if promoted:
+                    waits[(eid, promoted)] = False
+                    wait_counts[eid] = wait_count(eid) - 1
+                    regs[(eid, promoted)] = True
+                    counts[eid] = count(eid) + 1
+                results.append('unregistered')
+            elif waiting(eid, user):
+                waits[(eid, user)] = False
+                wait_counts[eid] = wait_count(eid) - 1
+                results.append('unregistered')
+            else:
+                results.append('not_registered')
+
+        today = datetime.date.today().isoformat()
+        for table, decided in ((registrations_table, regs), (waitlist_table, waits)):
+            added = [{'event_id': e, 'username': u, 'registered_on': today} for (e, u), on in decided.items()
+                     if on and not table.find(event_id=e, username=u)]
+            dropped = [r.doc_id for (e, u), on in decided.items() if not on for r in table.find(event_id=e, username=u)]
+            if added:
+                table.insert_multiple(added)
+            if dropped:
+                table.remove(doc_ids=dropped)
+        for eid, n in counts.items():
+            if n > 0:
+                participant_counts[eid] = n
+            else:
+                participant_counts.pop(eid, None)
+        if regs or waits:
+            mark_changed(*[('event', eid) for eid in {e for e, _ in list(regs) + list(waits)}])
+        return results
+
+
+registration_writer = BatchWriter(apply_registration_batch)
+
+password_pool = HashPool(
+    workers=int(os.environ.get('CLUBHUB_HASH_WORKERS', 0)) or None,
+    max_pending=int(os.environ.get('CLUBHUB_HASH_QUEUE', 0)) or None,
+    method=os.environ.get('CLUBHUB_HASH_METHOD', DEFAULT_METHOD),
+    cache_ttl=int(os.environ.get('CLUBHUB_LOGIN_CACHE_TTL', 300)),
+)
+
+
+def drop_event_rows(eids):
+    for table in (registrations_table, waitlist_table):
+        doc_ids = [r.doc_id for eid in eids for r in table.find(event_id=eid)]
+        if doc_ids:
+            table.remove(doc_ids=doc_ids)
+    for eid in eids:
+        participant_counts.pop(eid, None)
+
+
+def purge_orphans():
+    """Drop registrations and waitlist rows whose event no longer exists; returns the event ids dropped."""
+    with db_lock:
+        live = set(events_table.values('id'))
+        orphans = [eid for table in (registrations_table, waitlist_table)
+                   for eid in list(table.values('event_id')) if eid not in live]
+        drop_event_rows(orphans)
+    return sorted(set(orphans))
+
+
+def archive_past_events(days=None):
+    """Move events dated more than ``days`` ago, with their registrations, into the archive."""
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = (datetime.date.today() - datetime.timedelta(days)).isoformat()
+    with db_lock:
+        events = list(events_table.ordered(stop=cutoff))
+        eids = [e['id'] for e in events]
+        regs = [r for eid in eids for r in registrations_table.find(event_id=eid)]
+        # copied before anything is removed, so an interrupted run loses nothing and the next one finishes it
+        archived_events, archived_regs = archive.store(events, regs, participant_counts)
+        if events:
+            events_table.remove(doc_ids=[e.doc_id for e in events])
+            drop_event_rows(eids)
+    orphans = purge_orphans()
+    if events or orphans:
+        mark_changed(*[('event', eid) for eid in eids + orphans], dropped=True)
+    return {'cutoff': cutoff, 'events': archived_events, 'registrations': archived_regs, 'orphaned': len(orphans)}
+
+
+def check_import_row(kind, doc, seen):
+    """Raise RowError if ``doc`` clashes with the database or an earlier row; ``seen`` carries the earlier rows."""
+    if kind == 'clubs':
+        if clubs_table.find(name=doc['name']) or doc['name'] in seen:
+            raise RowError(f"club {doc['name']!r} already exists")
+        seen[doc['name']] = True
+    elif kind == 'events':
+        if not clubs_table.find(name=doc['club_name']):
+            raise RowError(f"no club named {doc['club_name']!r}")
+        if doc['id'] and (events_table.find(id=doc['id']) or doc['id'] in seen):
+            raise RowError(f"event id {doc['id']!r} already exists")
+        seen[doc['id']] = True
+    elif kind == 'users':
+        if users_table.find(username=doc['username']) or doc['username'] in seen:
+            raise RowError(f"username {doc['username']!r} is taken")
+        seen[doc['username']] = True
+    elif kind == 'registrations':
+        eid, user = doc['event_id'], doc['username']
+        event = events_table.find_one(id=eid)
+        if not event:
+            raise RowError(f"no event with id {eid!r}")
+        if not users_table.find(username=user):
+            raise RowError(f"no user named {user!r}")
+        if (eid, user) in seen or registrations_table.find(event_id=eid, username=user) \
+                or waitlist_table.find(event_id=eid, username=user):
+            raise RowError(f"{user} is already registered for {eid}")
+        seen[(eid, user)] = True
+        # mirror apply_registration_batch's decision so a full event is reported here, not silently dropped
+        if event.get('capacity') is not None:
+            taken = seen[eid] = seen.get(eid, 0) + 1
+            room = event['capacity'] + event.get('waitlist', 0)
+            if participant_counts.get(eid, 0) + waitlist_table.count_of('event_id', eid) + taken > room:
+                raise RowError(f"event {eid} is full")
+
+
+def import_rows(kind, rows, created_by, skip_invalid=False):
+    """Validate ``(line, row, error)`` rows from read_rows() and insert them in one batch.
+
+    Returns ``(imported, errors)`` where errors is a list of ``(line, message)``. Unless
+    ``skip_invalid`` is set, a single bad row means nothing is imported.
+    """
+    docs, errors, seen = [], [], {}
+    for line, row, error in rows:
+        try:
+            if error:
+                raise RowError(error)
+            doc = clean_row(kind, row)
+            check_import_row(kind, doc, seen)
+        except RowError as exc:
+            errors.append((line, str(exc)))
+        else:
+            docs.append((line, doc))
+    if errors and not skip_invalid:
+        return 0, errors
+
+    # scrypt is the slow part of a roster import, so it runs on the pool before the lock is taken
+    plain = [doc for _, doc in docs if 'password_plain' in doc]
+    for doc, hashed in zip(plain, password_pool.hash_many([doc.pop('password_plain') for doc in plain])):
+        doc['password'] = hashed
+
+    with db_lock:
+        # re-check against anything written since the first pass
+        seen, valid = {}, []
+        for line, doc in docs:
+            try:
+                check_import_row(kind, doc, seen)
+            except RowError as exc:
+                errors.append((line, str(exc)))
+            else:
+                valid.append(doc)
+        if errors and not skip_invalid:
+            return 0, sorted(errors)
+        if kind == 'registrations':
+            apply_registration_batch([('register', d['event_id'], d['username']) for d in valid])
+            return len(valid), sorted(errors)
+        if kind == 'events':
+            for doc in valid:
+                doc['id'] = doc['id'] or str(uuid.uuid4())
+        if kind in ('clubs', 'events'):
+            for doc in valid:
+                doc['created_by'] = created_by
+        table = {'clubs': clubs_table, 'events': events_table, 'users': users_table}[kind]
+        if valid:
+            table.insert_multiple(valid)
+    if valid and kind != 'users':
+        mark_changed()
+    return len(valid), sorted(errors)
 
 
 def initialize_system():
     print("--- SYSTEM STARTUP ---")
-    User = Query()
-    
-   
-    if not users_table.search(User.username == 'admin'):
-        users_table.insert({'username': 'admin', 'password': generate_password_hash('123'), 'role': 'admin'})
-    if not users_table.search(User.username == 'student'):
-        users_table.insert({'username': 'student', 'password': generate_password_hash('123'), 'role': 'student'})
+    with db_lock:
+        if not users_table.find(username='admin'):
+            users_table.insert({'username': 'admin', 'password': password_pool.hash('123'), 'role': 'admin'})
+        if not users_table.find(username='student'):
+            users_table.insert({'username': 'student', 'password': password_pool.hash('123'), 'role': 'student'})
 
-    
-    if not clubs_table.all():
-        clubs_table.insert_multiple([
-            {'name': 'Campus Tech', 'description': 'Coding, gadgets, and all things tech.', 'leader': 'Alice Admin', 'founded': '2023-01-15', 'created_by': 'admin'},
-            {'name': 'Drama Club', 'description': 'Theater and improv.', 'leader': 'Bob Admin', 'founded': '2023-03-10', 'created_by': 'admin'},
-            {'name': 'Green Earth', 'description': 'Sustainability & Gardening.', 'leader': 'Charlie Green', 'founded': '2023-04-22', 'created_by': 'admin'}
-        ])
-
-   
-    if not events_table.all():
-        today = datetime.date.today()
-        events_table.insert_multiple([
-            {'id': str(uuid.uuid4()), 'title': 'Mega Hackathon 2025', 'club_name': 'Campus Tech', 'type': 'Competition', 'date': (today + datetime.timedelta(days=14)).strftime("%Y-%m-%d"), 'location': 'Eng Block A', 'description': '24h coding marathon.', 'created_by': 'admin'},
-            {'id': str(uuid.uuid4()), 'title': 'Improv Night', 'club_name': 'Drama Club', 'type': 'Comedy', 'date': (today + datetime.timedelta(days=5)).strftime("%Y-%m-%d"), 'location': 'Auditorium', 'description': 'Laugh with us!', 'created_by': 'admin'},
-            {'id': str(uuid.uuid4()), 'title': 'Garden Cleanup', 'club_name': 'Green Earth', 'type': 'Social', 'date': (today + datetime.timedelta(days=2)).strftime("%Y-%m-%d"), 'location': 'North Garden', 'description': 'Snacks provided!', 'created_by': 'admin'}
-        ])
+
+        if not len(clubs_table):
+            clubs_table.insert_multiple([
+                {'name': 'Campus Tech', 'description': 'Coding, gadgets, and all things tech.', 'leader': 'Alice Admin', 'founded': '2023-01-15', 'created_by': 'admin'},
+                {'name': 'Drama Club', 'description': 'Theater and improv.', 'leader': 'Bob Admin', 'founded': '2023-03-10', 'created_by': 'admin'},
+                {'name': 'Green Earth', 'description': 'Sustainability & Gardening.', 'leader': 'Charlie Green', 'founded': '2023-04-22', 'created_by': 'admin'}
+            ])
+
+
+        if not len(events_table):
+            today = datetime.date.today()
+            events_table.insert_multiple([
+                {'id': str(uuid.uuid4()), 'title': 'Mega Hackathon 2025', 'club_name': 'Campus Tech', 'type': 'Competition', 'date': (today + datetime.timedelta(days=14)).strftime("%Y-%m-%d"), 'location': 'Eng Block A', 'description': '24h coding marathon.', 'created_by': 'admin'},
+                {'id': str(uuid.uuid4()), 'title': 'Improv Night', 'club_name': 'Drama Club', 'type': 'Comedy', 'date': (today + datetime.timedelta(days=5)).strftime("%Y-%m-%d"), 'location': 'Auditorium', 'description': 'Laugh with us!', 'created_by': 'admin'},
+                {'id': str(uuid.uuid4()), 'title': 'Garden Cleanup', 'club_name': 'Green Earth', 'type': 'Social', 'date': (today + datetime.timedelta(days=2)).strftime("%Y-%m-%d"), 'location': 'North Garden', 'description': 'Snacks provided!', 'created_by': 'admin'}
+            ])
     print("--- SYSTEM READY ---")
 
 
 STYLES = """
-<link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-<link href="https://fonts.googleapis.com/css2?family=Dancing+Script:wght@700&display=swap" rel="stylesheet">
-<style>
     :root {
         /* YOUR CUSTOM PALETTE (Default is now the Dark Lux Look) */
         --bg: #050505;           /* Rich Black */
@@ -109,6 +573,7 @@ STYLES = """
     .nav-links { display: flex; gap: 1rem; align-items: center; }
     .nav a { text-decoration: none; color: var(--text-muted); font-weight: 600; font-size: 0.95rem; }
     .nav a:hover { color: var(--primary); }
+    .nav-search .form-control { padding: 0.45rem 0.75rem; width: 14rem; }
     
     /* Buttons */
     .btn { display: inline-flex; justify-content: center; align-items: center; padding: 0.75rem 1.25rem; border-radius: 0.5rem; font-weight: 600; cursor: pointer; border: none; font-size: 0.95rem; width: 100%; transition: all 0.2s; text-decoration: none; }
@@ -179,7 +644,7 @@ STYLES = """
     .chat-head { background: var(--primary); color: #050505; padding: 10px 15px; font-weight: bold; display: flex; justify-content: space-between; }
     .chat-body { flex: 1; padding: 10px; overflow-y: auto; display: flex; flex-direction: column; gap: 8px; }
     .chat-msg { padding: 8px 12px; border-radius: 8px; max-width: 85%; font-size: 0.9rem; }
-    .msg-bot { background: var(--chat-bot); color: var(--chat-text-bot); align-self: flex-start; border: 1px solid var(--border); }
+    .msg-bot { background: var(--chat-bot); color: var(--chat-text-bot); align-self: flex-start; border: 1px solid var(--border); white-space: pre-line; }
     .msg-user { background: var(--chat-user); color: #050505; align-self: flex-end; font-weight: 500; }
     .chat-foot { padding: 10px; border-top: 1px solid var(--border); display: flex; gap: 5px; background: var(--input-bg); }
     
@@ -188,12 +653,10 @@ STYLES = """
     .alert-success { background: #003300; color: #ccffcc; border: 1px solid var(--success); }
     
     .empty-state { text-align: center; padding: 6rem 1rem; color: var(--text-muted); }
-</style>
 """
 
 
 SCRIPTS = """
-<script>
 document.addEventListener('DOMContentLoaded', () => {
     // THEME LOGIC
     const btn = document.getElementById('theme-toggle');
@@ -209,6 +672,75 @@ document.addEventListener('DOMContentLoaded', () => {
         btn.textContent = next === 'light' ? '🌙' : '☀️';
     });
 
+    // SEARCH SUGGESTIONS
+    const suggestList = document.getElementById('search-suggest');
+    let suggestTimer = null;
+    document.querySelectorAll('input[list="search-suggest"]').forEach(input => {
+        input.addEventListener('input', () => {
+            clearTimeout(suggestTimer);
+            const q = input.value;
+            if(!q.trim()) return;
+            suggestTimer = setTimeout(() => {
+                fetch('/api/suggest?q=' + encodeURIComponent(q)).then(r=>r.json()).then(d => {
+                    suggestList.replaceChildren(...d.suggestions.map(s => {
+                        const o = document.createElement('option');
+                        o.value = s.label;
+                        o.label = s.type === 'club' ? 'Club' : [s.club, s.date].filter(Boolean).join(' · ');
+                        return o;
+                    }));
+                });
+            }, 120);
+        });
+    });
+
+    // LIVE PARTICIPANT COUNTS
+    const counters = {};
+    document.querySelectorAll('[data-live-count]').forEach(el => {
+        (counters[el.dataset.liveCount] = counters[el.dataset.liveCount] || []).push(el);
+    });
+    function showCount(eid, n) {
+        (counters[eid] || []).forEach(el => {
+            const cap = el.dataset.capacity;
+            el.textContent = `👥 ${n}${cap !== '' ? ' / ' + cap : ''} Participant${n != 1 ? 's' : ''}`;
+        });
+    }
+    const liveIds = Object.keys(counters);
+    if(liveIds.length && window.EventSource){
+        const live = new EventSource('/live/counts?events=' + encodeURIComponent(liveIds.join(','))
+            + '&since=' + encodeURIComponent(document.body.dataset.liveSince || ''));
+        live.onmessage = m => { const d = JSON.parse(m.data); for(const eid in d) showCount(eid, d[eid]); };
+        live.addEventListener('reset', m => { const d = JSON.parse(m.data); liveIds.forEach(eid => showCount(eid, d[eid] || 0)); });
+    }
+
+    // REGISTER / UNREGISTER IN PLACE
+    function showMessage(text, category) {
+        const box = document.querySelector('.main-content > .container');
+        if(!box) return;
+        const d = document.createElement('div');
+        d.className = 'alert alert-' + (category === 'error' ? 'error' : 'success');
+        d.textContent = text;
+        box.replaceChildren(d);
+    }
+    document.addEventListener('submit', ev => {
+        const form = ev.target;
+        const action = form.getAttribute('action') || '';
+        if(!action.startsWith('/register_event/') && !action.startsWith('/unregister/')) return;
+        ev.preventDefault();
+        const slot = form.parentElement;
+        form.querySelectorAll('button').forEach(b => b.disabled = true);
+        fetch(form.action, {method:'POST', headers:{'Accept':'application/json'}})
+        .then(r => {
+            if(r.status === 401){ location.href = '/login'; return null; }
+            return r.json();
+        }).then(d => {
+            if(!d) return;
+            if(d.actions !== undefined) slot.innerHTML = d.actions;
+            else form.querySelectorAll('button').forEach(b => b.disabled = false);
+            showCount(d.event_id, d.participants);
+            if(d.message) showMessage(d.message, d.category);
+        }).catch(() => form.submit());
+    });
+
     // CHATBOT LOGIC
     const chatBtn = document.getElementById('chat-btn');
     const chatWin = document.getElementById('chat-win');
@@ -239,21 +771,53 @@ document.addEventListener('DOMContentLoaded', () => {
         chatIn.onkeypress = (e) => { if(e.key === 'Enter') send(); }
     }
 });
-</script>
 """
 
 
-def render_page(content, hero_html=""):
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'fonts')
+# self-hosted latin subsets of the two Google Fonts families; 'flask fetch-fonts' downloads them,
+# and until it has, the page links Google's stylesheet for any that are missing
+FONT_FILES = {
+    'inter-latin.woff2': ('Inter', '400 800', 'Inter:wght@400..800'),
+    'dancing-script-latin.woff2': ('Dancing Script', '700', 'Dancing+Script:wght@700'),
+}
+
+
+def register_assets():
+    faces = ""
+    preloads = ""
+    missing = []
+    for filename, (family, weight, spec) in FONT_FILES.items():
+        path = os.path.join(FONT_DIR, filename)
+        if not os.path.exists(path):
+            missing.append(spec)
+            continue
+        with open(path, 'rb') as f:
+            url = add_asset(filename, f.read(), 'font/woff2', compress=False)
+        faces += f"@font-face {{ font-family: '{family}'; font-style: normal; font-weight: {weight}; font-display: swap; src: url({url}) format('woff2'); }}\n"
+        preloads += f'<link rel="preload" href="{url}" as="font" type="font/woff2" crossorigin>'
+    add_asset('app.css', faces + STYLES, 'text/css')
+    add_asset('app.js', SCRIPTS, 'text/javascript')
+    if missing:
+        families = '&'.join(f'family={spec}' for spec in missing)
+        preloads += f'<link href="https://fonts.googleapis.com/css2?{families}&display=swap" rel="stylesheet">'
+    return preloads
+
+
+FONT_PRELOADS = register_assets()
+
+
+def page_head(hero_html=""):
     nav_links = ""
     if 'username' in session:
         role_badge = '<span class="badge-admin">ADMIN</span>' if session.get('role') == 'admin' else ''
         nav_links += f"""<span style="color:var(--text-muted); font-size:0.9rem;">Hi, <strong>{session['username']}</strong>{role_badge}</span>
-        <a href="/">Events</a><a href="/clubs">Clubs</a>"""
+        <a href="/">Events</a><a href="/clubs">Clubs</a><a href="/history">History</a>"""
         if session.get('role') == 'admin':
-            nav_links += """<a href="/create_event" class="btn-nav-primary">Host Event</a>"""
+            nav_links += """<a href="/stats">Stats</a><a href="/admin/import">Import</a><a href="/create_event" class="btn-nav-primary">Host Event</a>"""
         nav_links += '<a href="/logout" style="color:var(--danger)">Logout</a>'
     else:
-        nav_links = """<a href="/">Events</a><a href="/clubs">Clubs</a><a href="/login" class="btn-nav-secondary">Log In</a><a href="/signup" class="btn-nav-primary">Sign Up</a>"""
+        nav_links = """<a href="/">Events</a><a href="/clubs">Clubs</a><a href="/history">History</a><a href="/login" class="btn-nav-secondary">Log In</a><a href="/signup" class="btn-nav-primary">Sign Up</a>"""
 
     msgs_html = ""
     messages = get_flashed_messages(with_categories=True)
@@ -265,10 +829,13 @@ def render_page(content, hero_html=""):
     logo_svg = """<svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M17 21v-2a4 4 0 0 0-4-4H5a4 4 0 0 0-4 4v2"></path><circle cx="9" cy="7" r="4"></circle><path d="M23 21v-2a4 4 0 0 0-3-3.87"></path><path d="M16 3.13a4 4 0 0 1 0 7.75"></path></svg>"""
 
     return f"""
-    <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>ClubHub</title>{STYLES}</head>
-    <body>
-        <nav class="nav"><div class="nav-container"><a href="/" class="nav-brand">{logo_svg} ClubHub</a><div class="nav-links">{nav_links}<button id="theme-toggle" style="background:none;border:none;cursor:pointer;font-size:1.2rem;">☀️</button></div></div></nav>
-        <div class="main-content">{hero_html}<div class="container" style="margin-top:2rem;">{msgs_html}</div>{content}</div>
+    <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>ClubHub</title>{FONT_PRELOADS}<link rel="stylesheet" href="{asset_urls['app.css']}"></head>
+    <body data-live-since="{live_counts.last_id()}">
+        <nav class="nav"><div class="nav-container"><a href="/" class="nav-brand">{logo_svg} ClubHub</a><div class="nav-links"><form action="/search" class="nav-search"><input name="q" class="form-control" placeholder="Search…" list="search-suggest" autocomplete="off"><datalist id="search-suggest"></datalist></form>{nav_links}<button id="theme-toggle" style="background:none;border:none;cursor:pointer;font-size:1.2rem;">☀️</button></div></div></nav>
+        <div class="main-content">{hero_html}<div class="container" style="margin-top:2rem;">{msgs_html}</div>"""
+
+
+PAGE_TAIL = f"""</div>
         <div style="text-align:center; padding:3rem; color:var(--text-muted);">&copy; 2025 ClubHub</div>
         
         <div class="chat-widget">
@@ -279,46 +846,68 @@ def render_page(content, hero_html=""):
                 <div class="chat-foot"><input id="chat-input" class="form-control" style="margin:0" placeholder="Type..."><button id="chat-send" class="btn-primary" style="padding:0 15px; border-radius:5px;">➤</button></div>
             </div>
         </div>
-        {SCRIPTS}
+        <script src="{asset_urls['app.js']}"></script>
     </body></html>
     """
 
 
+def render_page(content, hero_html=""):
+    return page_head(hero_html) + content + PAGE_TAIL
+
+
+def stream_page(chunks, hero_html=""):
+    # the head is built before returning so flashed messages are popped while the session can still be saved
+    head = page_head(hero_html)
+
+    def generate():
+        yield head
+        chunks_iter = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks_iter, None)
+            record_time('render', time.perf_counter() - start)
+            if chunk is None:
+                break
+            yield chunk
+        yield PAGE_TAIL
+    return Response(stream_with_context(generate()), mimetype='text/html')
 
-@app.route('/')
-def home():
-    user = session.get('username')
-    role = session.get('role')
-    events = sorted(events_table.all(), key=lambda x: x.get('date', '9999'))
-    
-    for e in events:
-        if 'id' not in e:
-            uid = str(uuid.uuid4())
-            events_table.update({'id': uid}, Query().title == e['title'])
-            e['id'] = uid
 
-    my_regs = [r['event_id'] for r in registrations_table.search(Query().username == user)] if user else []
-    
-    hero = """<div class="hero"><div class="container"><h1>Connect. Participate. Lead.</h1><p>Your hub for campus events and clubs.</p></div></div>"""
-    
-    html = '<div class="container"><div class="grid">'
-    if not events:
-        html += '<p>No events found.</p>'
-    
-    for e in events:
-        p_count = registrations_table.count(Query().event_id == e['id'])
-        if not user:
-            btn = '<a href="/login" class="btn btn-outline">Login to Register</a>'
-        elif e['id'] in my_regs:
-            btn = f"""<form action="/unregister/{e['id']}" method="POST"><button class="btn btn-registered">✓ Registered</button></form>"""
-        else:
-            btn = f"""<form action="/register_event/{e['id']}" method="POST"><button class="btn btn-primary">Register Now</button></form>"""
-        
-        del_btn = ""
-        if role == 'admin':
-            del_btn = f"""<form action="/delete_event/{e['id']}" method="POST" style="margin-top:10px;"><button class="btn btn-danger">Delete Event</button></form>"""
 
-        html += f"""
+EVENTS_PER_PAGE = int(os.environ.get('CLUBHUB_EVENTS_PER_PAGE', 30))
+CARDS_PER_CHUNK = 50
+EVENT_WINDOWS = {'all': 'All', 'upcoming': 'Upcoming', 'past': 'Past'}
+
+
+def encode_cursor(event, table=events_table):
+    value, doc_id = table.order_key(event)
+    return f"{value}_{doc_id}"
+
+
+def decode_cursor(cursor):
+    value, _, doc_id = (cursor or '').rpartition('_')
+    return (value, int(doc_id)) if value and doc_id.isdigit() else None
+
+
+def events_page(when, after, limit=EVENTS_PER_PAGE):
+    # upcoming runs forward from today, past runs backward from yesterday, all is the full date order
+    today = datetime.date.today().isoformat()
+    if when == 'upcoming':
+        it = events_table.ordered(start=today, after=after)
+    elif when == 'past':
+        it = events_table.ordered(stop=today, after=after, reverse=True)
+    else:
+        it = events_table.ordered(after=after)
+    page = list(itertools.islice(it, limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def event_card(e):
+    def build():
+        p_count = participant_counts.get(e['id'], 0)
+        capacity = f" / {e['capacity']}" if e.get('capacity') is not None else ''
+        head = f"""
         <div class="card">
             <h3 class="card-title">{e['title']}</h3>
             <div style="display:flex; justify-content:space-between; margin-bottom:10px;">
@@ -326,48 +915,464 @@ def home():
                 <small style="color:var(--primary); font-weight:bold;">{e['club_name']}</small>
             </div>
             <p style="color:var(--text-muted); flex-grow:1;">{e['description']}</p>
-            <div style="margin-bottom:0.5rem; font-size:0.9rem; font-weight:600; color:var(--text-main);">
-                👥 {p_count} Participant{'s' if p_count != 1 else ''}
+            <div data-live-count="{e['id']}" data-capacity="{e['capacity'] if e.get('capacity') is not None else ''}" style="margin-bottom:0.5rem; font-size:0.9rem; font-weight:600; color:var(--text-main);">
+                👥 {p_count}{capacity} Participant{'s' if p_count != 1 else ''}
             </div>
             <div class="card-meta"><span>📅 {e['date']}</span><span>📍 {e['location']}</span></div>
-            <div style="margin-top:1.5rem; display:flex; flex-direction:column; gap:0.5rem;">{btn}{del_btn}</div>
+            <div style="margin-top:1.5rem; display:flex; flex-direction:column; gap:0.5rem;">"""
+        return head, """</div>
         </div>"""
+    return cached_card(('event', e['id']), build)
+
+
+def event_actions(e, user, role, my_regs, my_waits):
+    if not user:
+        btn = '<a href="/login" class="btn btn-outline">Login to Register</a>'
+    elif e['id'] in my_regs:
+        btn = f"""<form action="/unregister/{e['id']}" method="POST"><button class="btn btn-registered">✓ Registered</button></form>"""
+    elif e['id'] in my_waits:
+        btn = f"""<form action="/unregister/{e['id']}" method="POST"><button class="btn btn-outline">⏳ Waitlisted</button></form>"""
+    else:
+        btn = f"""<form action="/register_event/{e['id']}" method="POST"><button class="btn btn-primary">Register Now</button></form>"""
+
+    del_btn = ""
+    if role == 'admin':
+        del_btn = f"""<form action="/delete_event/{e['id']}" method="POST" style="margin-top:10px;"><button class="btn btn-danger">Delete Event</button></form>"""
+        del_btn += f"""<a href="/export/events/{e['id']}/registrations.csv" class="btn btn-outline" style="margin-top:10px;">Export Registrations</a>"""
+    return btn + del_btn
+
+
+def club_card(c):
+    def build():
+        return f"""<div class="card"><h3 class="card-title">{c['name']}</h3><p>{c['description']}</p><small style="color:var(--secondary);">Leader: {c['leader']}</small>""", "</div>"
+    return cached_card(('club', c['name']), build)
+
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    if name not in assets:
+        return 'Not found', 404
+    mimetype, variants, digest = assets[name]
+    encoding = pick_encoding(request.accept_encodings, variants)
+    resp = make_response(variants[encoding])
+    resp.mimetype = mimetype
+    resp.set_etag(f"{digest}-{encoding}")
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    return resp.make_conditional(request)
+
+
+def gzip_stream(chunks):
+    # sync-flush after every chunk so compression doesn't hold back what the view already yielded
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+SLOW_REQUEST_MS = float(os.environ.get('CLUBHUB_SLOW_REQUEST_MS', 500))
+
+registry.describe('clubhub_requests_total', 'counter', 'Requests by route, method and status.')
+registry.describe('clubhub_request_duration_seconds', 'histogram', 'Time from the start of a request until its body is complete.')
+registry.describe('clubhub_render_duration_seconds', 'histogram', 'Request time spent outside storage, password hashing and the batch writer.')
+registry.describe('clubhub_request_db_operations', 'histogram', 'Table operations per request.')
+use_request_stats(lambda: g.get('stats') if has_request_context() else None)
+
+
+@app.before_request
+def start_request_metrics():
+    g.stats = RequestStats()
+
+
+@app.before_request
+def sync_with_other_workers():
+    # one stat() of the change journal unless another worker has written since this one last looked
+    db_lock.sync()
+
+
+@app.after_request
+def note_view_done(resp):
+    g.status = resp.status_code
+    g.view_seconds = time.perf_counter() - g.stats.started
+    return resp
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # runs after the last chunk of a streamed response, so the stream is included
+    stats = g.pop('stats', None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.started
+    seconds = stats.seconds
+    seconds['render'] = max(0.0, g.get('view_seconds', elapsed) + seconds['render'] - seconds['db'] - seconds['hash'] - seconds['writer'])
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (('route', route), ('method', request.method))
+    registry.inc('clubhub_requests_total', labels + (('status', g.get('status', 500)),))
+    registry.observe('clubhub_request_duration_seconds', labels, elapsed)
+    registry.observe('clubhub_render_duration_seconds', labels, seconds['render'])
+    for op in ('read', 'search', 'write'):
+        n = sum(count for (_, kind), count in stats.ops.items() if kind == op)
+        registry.observe('clubhub_request_db_operations', labels + (('op', op),), n, COUNT_BUCKETS)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        app.logger.warning("slow request %s %s %.1f ms: %s", request.method, request.full_path.rstrip('?'),
+                           elapsed * 1000, stats.breakdown())
+
+
+@app.route('/metrics')
+def metrics_page():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.after_request
+def compress_response(resp):
+    if (resp.status_code != 200 or resp.direct_passthrough
+            or 'Content-Encoding' in resp.headers
+            or resp.mimetype not in ('text/html', 'application/json', 'text/csv', 'application/x-ndjson', 'text/calendar')):
+        return resp
+    if resp.is_streamed:
+        if request.accept_encodings['gzip'] > 0:
+            resp.response = gzip_stream(resp.response)
+            resp.headers['Content-Encoding'] = 'gzip'
+            resp.headers.pop('Content-Length', None)
+            resp.vary.add('Accept-Encoding')
+        return resp
+    body = resp.get_data()
+    encoding = pick_encoding(request.accept_encodings, ENCODINGS)
+    if len(body) < 1024 or encoding == 'identity':
+        return resp
+    resp.set_data(compress_body(body, encoding))
+    resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+@app.route('/')
+@conditional_page
+def home():
+    user = session.get('username')
+    role = session.get('role')
+    when = request.args.get('when', 'all')
+    if when not in EVENT_WINDOWS: when = 'all'
+    events, next_cursor = events_page(when, decode_cursor(request.args.get('after')))
+
+    my_regs = {r['event_id'] for r in registrations_table.find(username=user)} if user else set()
+    my_waits = {r['event_id'] for r in waitlist_table.find(username=user)} if user else set()
     
-    html += '</div></div>'
-    return render_page(html, hero)
+    hero = """<div class="hero"><div class="container"><h1>Connect. Participate. Lead.</h1><p>Your hub for campus events and clubs.</p></div></div>"""
+    
+    tabs = "".join(f"""<a href="{url_for('home', when=w)}" class="btn {'btn-primary' if w == when else 'btn-outline'} btn-auto">{label}</a>""" for w, label in EVENT_WINDOWS.items())
+    if user:
+        feed = url_for('user_calendar', username=user, token=calendar_token(user), _external=True)
+        tabs += f"""<a href="{feed}" class="btn btn-outline btn-auto" style="margin-left:auto;" title="Subscribe in your calendar app">📅 Add to calendar</a>"""
+    more = ""
+    if next_cursor:
+        more = f"""<div style="text-align:center; margin-top:2rem;"><a href="{url_for('home', when=when, after=next_cursor)}" class="btn btn-outline btn-auto">More events &rarr;</a></div>"""
+
+    def cards():
+        yield f'<div class="container"><div style="display:flex; gap:0.5rem; margin-bottom:1.5rem;">{tabs}</div><div class="grid">'
+        if not events:
+            yield '<p>No events found.</p>'
+        chunk = []
+        for e in events:
+            head, tail = event_card(e)
+            chunk.append(head + event_actions(e, user, role, my_regs, my_waits) + tail)
+            if len(chunk) == CARDS_PER_CHUNK:
+                yield "".join(chunk)
+                chunk = []
+        yield "".join(chunk) + '</div>' + more + '</div>'
+
+    return stream_page(cards(), hero)
+
+
+@app.route('/api/events')
+def api_events():
+    user = session.get('username')
+    when = request.args.get('when', 'all')
+    if when not in EVENT_WINDOWS:
+        return jsonify({'error': f"when must be one of {', '.join(EVENT_WINDOWS)}"}), 400
+    limit = min(max(request.args.get('limit', EVENTS_PER_PAGE, type=int), 1), 100)
+    events, next_cursor = events_page(when, decode_cursor(request.args.get('after')), limit)
+    my_regs = {r['event_id'] for r in registrations_table.find(username=user)} if user else set()
+    items = []
+    for e in events:
+        item = {k: e.get(k) for k in ('id', 'title', 'club_name', 'type', 'date', 'location', 'description')}
+        item['participants'] = participant_counts.get(e.get('id'), 0)
+        if user:
+            item['registered'] = e.get('id') in my_regs
+        items.append(item)
+    return jsonify({'events': items, 'next': next_cursor})
 
 @app.route('/clubs')
+@conditional_page
 def clubs():
     role = session.get('role')
     create_btn = '<a href="/register_club" class="btn btn-outline btn-auto">+ Register New Club</a>' if role == 'admin' else ''
     html = f"""<div class="container"><div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:2rem;"><h2>Clubs</h2>{create_btn}</div><div class="grid">"""
-    for c in clubs_table.all():
+    for c in clubs_table:
         del_btn = ""
         if role == 'admin':
-            del_btn = f"""<div style="margin-top:1rem; border-top:1px solid var(--border); padding-top:1rem;"><form action="/delete_club/{c['name']}" method="POST" onsubmit="return confirm('Delete club?');"><button class="btn btn-danger">Delete Club</button></form></div>"""
-        html += f"""<div class="card"><h3 class="card-title">{c['name']}</h3><p>{c['description']}</p><small style="color:var(--secondary);">Leader: {c['leader']}</small>{del_btn}</div>"""
+            del_btn = f"""<div style="margin-top:1rem; border-top:1px solid var(--border); padding-top:1rem;"><form action="/delete_club/{c['name']}" method="POST" onsubmit="return confirm('Delete club?');"><button class="btn btn-danger">Delete Club</button></form><a href="/export/clubs/{c['name']}/registrations.csv" class="btn btn-outline" style="margin-top:10px;">Export Registrations</a></div>"""
+        head, tail = club_card(c)
+        feed = f"""<a href="{url_for('club_calendar', name=c['name'])}" class="btn btn-outline" style="margin-top:1rem;">📅 Calendar</a>"""
+        html += head + feed + del_btn + tail
     return render_page(html + '</div></div>')
 
+SEARCH_RESULTS = 30
+SUGGEST_LIMIT = 8
+
+
+@app.route('/history')
+@conditional_page
+def history():
+    user = session.get('username')
+    club = request.args.get('club') or None
+    mine = bool(user and request.args.get('mine'))
+    attended = archive.attended(user) if user else set()
+    events, more = archive.page(club, attended if mine else None, decode_cursor(request.args.get('after')), EVENTS_PER_PAGE)
+
+    def link(**args):
+        args = {'club': club, 'mine': 1 if mine else None, **args}
+        return url_for('history', **{k: v for k, v in args.items() if v})
+
+    tabs = f"""<a href="{link(mine=None)}" class="btn {'btn-outline' if mine else 'btn-primary'} btn-auto">All past events</a>"""
+    if user:
+        tabs += f"""<a href="{link(mine=1)}" class="btn {'btn-primary' if mine else 'btn-outline'} btn-auto">Events I went to</a>"""
+    if club:
+        tabs += f"""<a href="{link(club=None)}" class="btn btn-outline btn-auto">{escape(club)} ✕</a>"""
+    if session.get('role') == 'admin':
+        tabs += f"""<form action="/admin/archive" method="POST" style="margin-left:auto;"><button class="btn btn-outline btn-auto">Archive events over {ARCHIVE_AFTER_DAYS} days old</button></form>"""
+    html = f"""<div class="container"><h2 style="margin-bottom:1rem;">Event history</h2>
+    <div style="display:flex; gap:0.5rem; margin-bottom:1.5rem; flex-wrap:wrap;">{tabs}</div><div class="grid">"""
+    if not events:
+        html += '<p>No archived events.</p>'
+    for e in events:
+        went = '<div class="badge-tag" style="margin-top:1rem;">✓ You went</div>' if e['id'] in attended else ''
+        html += f"""<div class="card"><h3 class="card-title">{e['title']}</h3>
+            <div style="display:flex; justify-content:space-between; margin-bottom:10px;">
+                <span class="badge-tag">{e.get('type', 'Event')}</span>
+                <a href="{url_for('history', club=e['club_name'])}" style="color:var(--primary); font-weight:bold; font-size:0.85rem;">{e['club_name']}</a>
+            </div>
+            <p style="color:var(--text-muted); flex-grow:1;">{e.get('description', '')}</p>
+            <div style="font-size:0.9rem; font-weight:600;">👥 {e.get('participants', 0)} Participant{'s' if e.get('participants', 0) != 1 else ''}</div>
+            <div class="card-meta"><span>📅 {e.get('date', '')}</span><span>📍 {e.get('location', '')}</span></div>{went}</div>"""
+    html += '</div>'
+    if more:
+        html += f"""<div style="text-align:center; margin-top:2rem;"><a href="{link(after=encode_cursor(events[-1], archive.events))}" class="btn btn-outline btn-auto">Older events &rarr;</a></div>"""
+    return render_page(html + '</div>')
+
+
+@app.route('/admin/archive', methods=['POST'])
+def archive_now():
+    if session.get('role') != 'admin': return redirect('/')
+    done = archive_past_events()
+    flash(f"Archived {done['events']} event(s) from before {done['cutoff']} with {done['registrations']} registration(s); "
+          f"removed registrations for {done['orphaned']} deleted event(s).", 'success')
+    return redirect('/history')
+
+
+STATS_TOP = 10
+STATS_DAYS = 30
+
+
+def stats_report(top=STATS_TOP, last_days=STATS_DAYS):
+    summary = stats.summary(top, last_days)
+    events = []
+    for eid, n in summary['top_events']:
+        e = events_table.find_one(id=eid)
+        if e:
+            events.append({'id': eid, 'title': e.get('title'), 'club': e.get('club_name'), 'date': e.get('date'), 'registrations': n})
+    return {
+        'totals': {'clubs': len(clubs_table), 'events': len(events_table), 'users': len(users_table),
+                   'registrations': len(registrations_table), 'waitlisted': len(waitlist_table),
+                   'active_students': summary['active_students'], 'undated_registrations': summary['undated_registrations']},
+        'top_clubs': [{'club': c, 'events': n_events, 'registrations': n} for c, n_events, n in summary['top_clubs']],
+        'top_events': events,
+        'top_students': [{'username': u, 'registrations': n} for u, n in summary['top_students']],
+        'signups': [{'date': d, 'registrations': n} for d, n in summary['signups']],
+    }
+
+
+def stats_args():
+    return (min(max(request.args.get('top', STATS_TOP, type=int), 1), 100),
+            min(max(request.args.get('days', STATS_DAYS, type=int), 1), 366))
+
+
+def signup_chart(signups):
+    peak = max([row['registrations'] for row in signups] + [1])
+    bars = "".join(f"""<div title="{row['date']}: {row['registrations']}" style="flex:1; background:var(--primary); border-radius:2px 2px 0 0; height:{max(row['registrations'] / peak * 100, 1):.0f}%;"></div>""" for row in signups)
+    return f"""<div style="display:flex; align-items:flex-end; gap:2px; height:120px;">{bars}</div>
+    <div style="display:flex; justify-content:space-between; color:var(--text-muted); font-size:0.8rem; margin-top:0.4rem;"><span>{signups[0]['date']}</span><span>{signups[-1]['date']}</span></div>"""
+
+
+def stats_list(title, rows):
+    items = "".join(f'<li style="display:flex; justify-content:space-between; gap:1rem; padding:0.35rem 0; border-bottom:1px solid var(--border);"><span>{label}</span><strong>{n}</strong></li>' for label, n in rows)
+    return f"""<div class="card"><h3 class="card-title">{title}</h3><ul style="list-style:none; padding:0; margin:0;">{items or '<li>Nothing yet.</li>'}</ul></div>"""
+
+
+# not a conditional_page: its totals include users, and signups don't move data_version
+@app.route('/stats')
+def stats_page():
+    if session.get('role') != 'admin': return redirect('/')
+    club = request.args.get('club')
+    report = stats_report()
+    totals = report['totals']
+    tiles = "".join(f"""<div class="card" style="text-align:center;"><div style="font-size:1.8rem; font-weight:800; color:var(--primary);">{totals[key]}</div><small style="color:var(--text-muted);">{label}</small></div>"""
+                    for key, label in (('registrations', 'Registrations'), ('active_students', 'Active students'), ('events', 'Events'),
+                                       ('clubs', 'Clubs'), ('waitlisted', 'Waitlisted'), ('users', 'Users')))
+    trend_title, signups = f'Sign-ups, last {STATS_DAYS} days', report['signups']
+    if club and clubs_table.find(name=club):
+        detail = stats.club(club, STATS_DAYS)
+        trend_title = f"""{escape(club)}: {detail['registrations']} registrations for {detail['events']} events <a href="{url_for('stats_page')}" style="font-size:0.85rem;">✕</a>"""
+        signups = [{'date': d, 'registrations': n} for d, n in detail['signups']]
+    undated = f"""<small style="color:var(--text-muted);">{totals['undated_registrations']} older registrations have no sign-up date.</small>""" if totals['undated_registrations'] else ''
+    clubs_rows = [(f"""<a href="{url_for('stats_page', club=c['club'])}">{escape(c['club'])}</a> <small style="color:var(--text-muted);">{c['events']} events</small>""", c['registrations'])
+                  for c in report['top_clubs']]
+    event_rows = [(f"""{escape(e['title'])} <small style="color:var(--text-muted);">{escape(e['club'])} · {e['date']}</small>""", e['registrations'])
+                  for e in report['top_events']]
+    student_rows = [(escape(s['username']), s['registrations']) for s in report['top_students']]
+    html = f"""<div class="container"><div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:1.5rem;"><h2>Stats</h2>
+    <a href="{url_for('api_stats')}" class="btn btn-outline btn-auto">JSON</a></div>
+    <div class="grid" style="grid-template-columns:repeat(auto-fit, minmax(140px, 1fr)); margin-bottom:1.5rem;">{tiles}</div>
+    <div class="card" style="margin-bottom:1.5rem;"><h3 class="card-title">{trend_title}</h3>{signup_chart(signups)}{undated}</div>
+    <div class="grid">{stats_list('Top clubs', clubs_rows)}{stats_list('Top events', event_rows)}{stats_list('Most active students', student_rows)}</div></div>"""
+    return render_page(html)
+
+
+# the counters live in each serving process, so they can only be checked from inside one; with several
+# workers this checks whichever one answers
+@app.route('/admin/check-counts')
+def check_counts():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admins only.'}), 403
+    mismatches = check_participant_counts()
+    return jsonify({'ok': not mismatches, 'worker': os.getpid(),
+                    'mismatches': {eid: {'cached': cached, 'actual': actual}
+                                   for eid, (cached, actual) in sorted(mismatches.items())}})
+
+
+@app.route('/api/stats')
+def api_stats():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admins only.'}), 403
+    return jsonify(stats_report(*stats_args()))
+
+
+@app.route('/api/stats/clubs/<name>')
+def api_club_stats(name):
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admins only.'}), 403
+    if not clubs_table.find(name=name):
+        return jsonify({'error': 'No such club.'}), 404
+    detail = stats.club(name, stats_args()[1])
+    detail['signups'] = [{'date': d, 'registrations': n} for d, n in detail['signups']]
+    return jsonify(dict(detail, club=name))
+
+
+@app.route('/api/stats/events/<eid>')
+def api_event_stats(eid):
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admins only.'}), 403
+    if not events_table.find(id=eid):
+        return jsonify({'error': 'No such event.'}), 404
+    detail = stats.event(eid, stats_args()[1])
+    detail['signups'] = [{'date': d, 'registrations': n} for d, n in detail['signups']]
+    return jsonify(dict(detail, id=eid, waitlisted=waitlist_table.count_of('event_id', eid)))
+
+
+@app.route('/search')
+@conditional_page
+def search():
+    user = session.get('username')
+    role = session.get('role')
+    q = request.args.get('q', '').strip()[:200]
+    terms = tokenize(q)
+    events = [events_table.by_id(doc_id) for _, doc_id in event_words.search(terms, SEARCH_RESULTS)]
+    events = [e for e in events if e is not None]
+    clubs = [clubs_table.by_id(doc_id) for _, doc_id in club_text.search(terms, SEARCH_RESULTS)]
+    clubs = [c for c in clubs if c is not None]
+    my_regs = {r['event_id'] for r in registrations_table.find(username=user)} if user else set()
+    my_waits = {r['event_id'] for r in waitlist_table.find(username=user)} if user else set()
+
+    html = f"""<div class="container"><form action="/search" style="display:flex; gap:0.5rem; margin-bottom:2rem;">
+    <input name="q" value="{escape(q)}" class="form-control" placeholder="Search events and clubs" list="search-suggest" autocomplete="off" autofocus>
+    <button class="btn btn-primary btn-auto">Search</button></form>"""
+    if not terms:
+        return render_page(html + '<p style="color:var(--text-muted);">Search by title, club, type, place or description.</p></div>')
+    if not events and not clubs:
+        return render_page(html + f'<p>Nothing matches &ldquo;{escape(q)}&rdquo;.</p></div>')
+    if clubs:
+        html += '<h2 style="margin-bottom:1rem;">Clubs</h2><div class="grid" style="margin-bottom:2rem;">'
+        for c in clubs:
+            head, tail = club_card(c)
+            html += head + tail
+        html += '</div>'
+    if events:
+        html += '<h2 style="margin-bottom:1rem;">Events</h2><div class="grid">'
+        for e in events:
+            head, tail = event_card(e)
+            html += head + event_actions(e, user, role, my_regs, my_waits) + tail
+        html += '</div>'
+    return render_page(html + '</div>')
+
+
+@app.route('/api/suggest')
+def api_suggest():
+    q = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), 20)
+    tokens = tokenize(q)
+    # the last word is still being typed unless the query ends in a space
+    prefix = tokens.pop() if tokens and not q[-1:].isspace() else None
+    suggestions, seen = [], set()
+    for doc_id in club_text.suggest(tokens, prefix, limit):
+        c = clubs_table.by_id(doc_id)
+        if c and c['name'] not in seen:
+            seen.add(c['name'])
+            suggestions.append({'type': 'club', 'label': c['name']})
+    for doc_id in event_words.suggest(tokens, prefix, limit):
+        e = events_table.by_id(doc_id)
+        if e and e['title'] not in seen:
+            seen.add(e['title'])
+            suggestions.append({'type': 'event', 'label': e['title'], 'date': e.get('date'), 'club': e.get('club_name')})
+    suggestions = suggestions[:limit]
+    for item in suggestions:
+        item['url'] = url_for('search', q=item['label'])
+    return jsonify({'query': q, 'suggestions': suggestions})
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
-    msg = request.get_json().get('message', '').lower()
-    resp = "I can help with events, clubs, or registration."
-    if 'register' in msg: resp = "Log in, find an event, and click 'Register Now'."
-    elif 'host' in msg or 'create' in msg: resp = "Log in as Admin and click 'Host Event'."
-    elif 'club' in msg: resp = "Check the 'Clubs' page to join or start one."
-    return jsonify({'response': resp})
+    msg = (request.get_json(silent=True) or {}).get('message', '')
+    return jsonify({'response': chat_bot.answer(str(msg))})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    status = 200
     if request.method == 'POST':
-        results = users_table.search(Query().username == request.form['username'])
-        if results:
+        results = users_table.find(username=request.form['username'])
+        try:
+            ok, new_hash = password_pool.verify(results[0]['password'], request.form['password']) if results else (False, None)
+        except Busy:
+            flash('Too many sign-ins right now, please try again in a moment', 'error')
+            ok, new_hash, status = False, None, 503
+        if ok:
             u = results[0]
-            if check_password_hash(u['password'], request.form['password']):
-                session['username'] = u['username']
-                session['role'] = u.get('role', 'student') 
-                return redirect('/')
-        flash('Invalid credentials', 'error')
+            if new_hash:
+                with db_lock:
+                    users_table.update({'password': new_hash}, doc_ids=[u.doc_id])
+            session['username'] = u['username']
+            session['role'] = u.get('role', 'student') 
+            return redirect('/')
+        if status == 200:
+            flash('Invalid credentials', 'error')
     
     return render_page("""
     <div class="auth-wrapper">
@@ -392,19 +1397,28 @@ def login():
             </div>
         </div>
     </div>
-    """)
+    """), status
 
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
-        if users_table.search(Query().username == request.form['username']):
+        if users_table.find(username=request.form['username']):
             flash('Username taken', 'error')
         else:
-            users_table.insert({
-                'username': request.form['username'], 
-                'password': generate_password_hash(request.form['password']),
-                'role': request.form['role']
-            })
+            try:
+                password = password_pool.hash(request.form['password'])
+            except Busy:
+                flash('Too many sign-ups right now, please try again in a moment', 'error')
+                return redirect('/signup')
+            with db_lock:
+                if users_table.find(username=request.form['username']):
+                    flash('Username taken', 'error')
+                    return redirect('/signup')
+                users_table.insert({
+                    'username': request.form['username'], 
+                    'password': password,
+                    'role': request.form['role']
+                })
             flash('Account created', 'success')
             return redirect('/login')
     
@@ -449,27 +1463,38 @@ def logout():
 def create_event():
     if session.get('role') != 'admin': return redirect('/')
     if request.method == 'POST':
-        events_table.insert({
+        event = {
             'id': str(uuid.uuid4()),
             'title': request.form['title'], 'club_name': request.form['club_name'],
             'type': request.form['type'], 'date': request.form['date'],
             'location': request.form['location'], 'description': request.form['description'],
             'created_by': session['username']
-        })
+        }
+        # capacity and waitlist are optional; an event without a capacity takes everyone
+        for field in ('capacity', 'waitlist'):
+            value = request.form.get(field, type=int)
+            if value is not None and value >= 0:
+                event[field] = value
+        with db_lock:
+            events_table.insert(event)
+        mark_changed()
         flash('Event Created!', 'success')
         return redirect('/')
-    clubs = clubs_table.all()
+    clubs = list(clubs_table)
     if not clubs: return render_page('<div class="container">Please register a club first.</div>')
     opts = "".join([f"<option value='{c['name']}'>{c['name']}</option>" for c in clubs])
+    types = "".join(f"<option>{t}</option>" for t in EVENT_TYPES)
     return render_page(f"""
     <div class="auth-wrapper"><div class="auth-card">
     <h2 style="text-align:center; margin-bottom:1.5rem;">Host Event</h2><form method="POST">
     <div class="form-group"><label>Title</label><input name="title" class="form-control" required></div>
     <div class="form-group"><label>Club</label><select name="club_name" class="form-control">{opts}</select></div>
-    <div class="form-group"><label>Type</label><select name="type" class="form-control"><option>Competition</option><option>Comedy</option><option>Workshop</option><option>Social</option></select></div>
+    <div class="form-group"><label>Type</label><select name="type" class="form-control">{types}</select></div>
     <div class="form-group"><label>Date</label><input type="date" name="date" class="form-control" required></div>
     <div class="form-group"><label>Location</label><input name="location" class="form-control" required></div>
     <div class="form-group"><label>Description</label><textarea name="description" class="form-control"></textarea></div>
+    <div class="form-group"><label>Capacity (optional)</label><input type="number" min="1" name="capacity" class="form-control"></div>
+    <div class="form-group"><label>Waitlist size (optional)</label><input type="number" min="0" name="waitlist" class="form-control"></div>
     <button class="btn btn-primary" style="margin-top:1rem;">Publish</button></form></div></div>
     """)
 
@@ -477,14 +1502,18 @@ def create_event():
 def register_club():
     if session.get('role') != 'admin': return redirect('/')
     if request.method == 'POST':
-        if clubs_table.search(Query().name == request.form['name']):
+        with db_lock:
+            exists = clubs_table.find(name=request.form['name'])
+            if not exists:
+                clubs_table.insert({
+                    'name': request.form['name'], 'description': request.form['description'],
+                    'leader': request.form['leader'], 'founded': str(datetime.date.today()),
+                    'created_by': session['username']
+                })
+        if exists:
             flash('Club exists', 'error')
         else:
-            clubs_table.insert({
-                'name': request.form['name'], 'description': request.form['description'],
-                'leader': request.form['leader'], 'founded': str(datetime.date.today()),
-                'created_by': session['username']
-            })
+            mark_changed()
             return redirect('/clubs')
     return render_page("""
     <div class="auth-wrapper"><div class="auth-card">
@@ -498,38 +1527,291 @@ def register_club():
 @app.route('/delete_event/<eid>', methods=['POST'])
 def delete_event(eid):
     if session.get('role') == 'admin':
-        events_table.remove(Query().id == eid)
+        with db_lock:
+            events_table.remove_where(id=eid)
+            drop_event_rows([eid])
+        mark_changed(('event', eid), dropped=True)
         flash('Deleted', 'success')
     return redirect('/')
 
 @app.route('/delete_club/<name>', methods=['POST'])
 def delete_club(name):
     if session.get('role') == 'admin':
-        clubs_table.remove(Query().name == name)
-        events_table.remove(Query().club_name == name)
+        with db_lock:
+            clubs_table.remove_where(name=name)
+            eids = [e['id'] for e in events_table.find(club_name=name) if 'id' in e]
+            events_table.remove_where(club_name=name)
+            drop_event_rows(eids)
+        mark_changed(('club', name), *[('event', eid) for eid in eids], dropped=True)
         flash('Club deleted', 'success')
     return redirect('/clubs')
 
+REGISTRATION_MESSAGES = {
+    'waitlisted': ("This event is full - you're on the waitlist.", 'success'),
+    'full': ('This event is full.', 'error'),
+    'busy': ('Registrations are busy right now, please try again.', 'error'),
+}
+
+
+def wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
+def registration_done(eid, result):
+    # the event buttons post with fetch() and get the card's new state back; plain form posts go home
+    message = REGISTRATION_MESSAGES.get(result)
+    if not wants_json():
+        if message:
+            flash(*message)
+        return redirect('/')
+    user = session['username']
+    body = {'event_id': eid, 'result': result, 'participants': participant_counts.get(eid, 0)}
+    if message:
+        body['message'], body['category'] = message
+    event = events_table.find_one(id=eid)
+    if event:
+        my_regs = {eid} if registrations_table.find(event_id=eid, username=user) else set()
+        my_waits = {eid} if waitlist_table.find(event_id=eid, username=user) else set()
+        body['actions'] = event_actions(event, user, session.get('role'), my_regs, my_waits)
+    return jsonify(body), 503 if result == 'busy' else 200
+
+
 @app.route('/register_event/<eid>', methods=['POST'])
 def reg_event(eid):
-    if 'username' not in session: return redirect('/login')
-    if not registrations_table.search((Query().event_id == eid) & (Query().username == session['username'])):
-        registrations_table.insert({'event_id': eid, 'username': session['username']})
-    return redirect('/')
+    if 'username' not in session:
+        return (jsonify({'error': 'Log in to register.'}), 401) if wants_json() else redirect('/login')
+    try:
+        result = registration_writer.submit(('register', eid, session['username']))
+    except Busy:
+        result = 'busy'
+    return registration_done(eid, result)
 
 @app.route('/unregister/<eid>', methods=['POST'])
 def unreg(eid):
-    registrations_table.remove((Query().event_id == eid) & (Query().username == session.get('username')))
-    return redirect('/')
+    if 'username' not in session:
+        return (jsonify({'error': 'Log in to register.'}), 401) if wants_json() else redirect('/')
+    try:
+        result = registration_writer.submit(('unregister', eid, session['username']))
+    except Busy:
+        result = 'busy'
+    return registration_done(eid, result)
+
+
+LIVE_MAX_EVENTS = 200
+
+
+@app.route('/live/counts')
+def live_counts_stream():
+    # the stream doesn't hold the request context: an idle listener costs a parked thread and a sequence number
+    ids = [eid for eid in request.args.get('events', '').split(',') if eid][:LIVE_MAX_EVENTS]
+
+    def snapshot():
+        return {eid: participant_counts.get(eid, 0) for eid in ids} if ids else dict(participant_counts)
+    resp = Response(live_counts.listen(request.headers.get('Last-Event-ID') or request.args.get('since'), snapshot),
+                    mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 @app.route('/reset_db')
 def reset_db():
-    db.drop_tables()
-    initialize_system()
+    with db_lock:
+        db.drop_tables()
+        archive.clear()
+        rebuild_indexes()
+        stamp_version(meta_table, LATEST)
+        initialize_system()
+        rebuild_participant_counts()
+    reset_card_cache()
     session.clear()
     flash("Database wiped.", "success")
     return redirect('/login')
 
+IMPORT_KINDS = {'clubs': 'Clubs', 'events': 'Events', 'users': 'Users', 'registrations': 'Registrations'}
+IMPORT_COLUMNS = {
+    'clubs': 'name, leader, description, founded',
+    'events': 'title, club_name, type, date, location, description, capacity, waitlist, id',
+    'users': 'username, password (or password_hash), role',
+    'registrations': 'event_id, username',
+}
+MAX_LISTED_ERRORS = 100
+
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+def bulk_import():
+    if session.get('role') != 'admin': return redirect('/')
+    report = ""
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash('Choose what to import and a CSV or JSONL file', 'error')
+            return redirect('/admin/import')
+        rows = read_rows(upload.stream, format_for(upload.filename))
+        imported, errors = import_rows(kind, rows, session['username'], skip_invalid=bool(request.form.get('skip_invalid')))
+        listed = "".join(f"<li>Line {line}: {escape(msg)}</li>" for line, msg in errors[:MAX_LISTED_ERRORS])
+        if len(errors) > MAX_LISTED_ERRORS:
+            listed += f"<li>&hellip; and {len(errors) - MAX_LISTED_ERRORS} more</li>"
+        outcome = f"Imported {imported} {IMPORT_KINDS[kind].lower()}."
+        if errors and not imported:
+            outcome = f"Nothing was imported: {len(errors)} row(s) have errors."
+        elif errors:
+            outcome += f" Skipped {len(errors)} row(s) with errors."
+        report = f"""<div class="alert {'alert-error' if errors else 'alert-success'}">{outcome}</div>""" + (f"<ul style='margin:0 0 1.5rem 1.2rem; color:var(--text-muted);'>{listed}</ul>" if listed else "")
+    opts = "".join(f"<option value='{k}'>{label}</option>" for k, label in IMPORT_KINDS.items())
+    columns = "".join(f"<li><b>{IMPORT_KINDS[k]}</b>: {cols}</li>" for k, cols in IMPORT_COLUMNS.items())
+    return render_page(f"""
+    <div class="auth-wrapper"><div class="auth-card">
+    <h2 style="text-align:center; margin-bottom:1.5rem;">Bulk Import</h2>{report}
+    <form method="POST" enctype="multipart/form-data">
+    <div class="form-group"><label>Import</label><select name="kind" class="form-control">{opts}</select></div>
+    <div class="form-group"><label>File (.csv or .jsonl)</label><input type="file" name="file" accept=".csv,.jsonl,.ndjson" class="form-control" required></div>
+    <div class="form-group"><label><input type="checkbox" name="skip_invalid" value="1"> Import the valid rows even if some have errors</label></div>
+    <button class="btn btn-primary" style="margin-top:1rem;">Import</button></form>
+    <ul style="margin-top:1.5rem; padding-left:1.2rem; color:var(--text-muted); font-size:0.9rem;">{columns}</ul>
+    </div></div>
+    """)
+
+
+def export_response(docs, fields, fmt, filename):
+    resp = Response(stream_with_context(export_lines(docs, fields, fmt)),
+                    mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return resp
+
+
+def registration_rows(events):
+    for e in events:
+        for table, status in ((registrations_table, 'registered'), (waitlist_table, 'waitlisted')):
+            for r in table.find(event_id=e.get('id')):
+                yield {'event_id': e['id'], 'title': e['title'], 'date': e['date'], 'username': r['username'], 'status': status}
+
+
+@app.route('/export/<kind>.<fmt>')
+def export_table(kind, fmt):
+    if session.get('role') != 'admin': return redirect('/')
+    if kind not in FIELDS or fmt not in FORMATS:
+        return 'Not found', 404
+    table = {'clubs': clubs_table, 'events': events_table, 'users': users_table, 'registrations': registrations_table}[kind]
+    return export_response(iter(table), FIELDS[kind], fmt, kind)
+
+
+@app.route('/export/events/<eid>/registrations.<fmt>')
+def export_event_registrations(eid, fmt):
+    if session.get('role') != 'admin': return redirect('/')
+    event = events_table.find_one(id=eid)
+    if not event or fmt not in FORMATS:
+        return 'Not found', 404
+    return export_response(registration_rows([event]), REGISTRATION_EXPORT_FIELDS, fmt, f"registrations-{eid}")
+
+
+@app.route('/export/clubs/<name>/registrations.<fmt>')
+def export_club_registrations(name, fmt):
+    if session.get('role') != 'admin': return redirect('/')
+    if not clubs_table.find(name=name) or fmt not in FORMATS:
+        return 'Not found', 404
+    events = sorted(events_table.find(club_name=name), key=events_table.order_key)
+    return export_response(registration_rows(events), REGISTRATION_EXPORT_FIELDS, fmt, "registrations-club")
+
+
+def calendar_token(username):
+    # calendar apps can't log in, so a personal feed URL carries this instead of a session
+    return hmac.new(app.secret_key.encode(), f'calendar:{username}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def feed_response(key, build):
+    body, etag, modified = feed_cache.get(key, build)
+    resp = Response(body, mimetype='text/calendar')
+    # compress_response encodes the body after this, and each encoding is a different entity
+    encoding = pick_encoding(request.accept_encodings, ENCODINGS) if len(body) >= 1024 else 'identity'
+    resp.set_etag(etag if encoding == 'identity' else f'{etag}-{encoding}')
+    resp.last_modified = modified
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.vary.add('Accept-Encoding')
+    return resp.make_conditional(request)
+
+
+@app.route('/calendar/<username>.ics')
+def user_calendar(username):
+    token = request.args.get('token', '')
+    if session.get('username') != username and not hmac.compare_digest(token, calendar_token(username)):
+        return 'Not found', 404
+    if not users_table.find(username=username):
+        return 'Not found', 404
+
+    def build():
+        rows = [(e, status) for table, status in ((registrations_table, 'CONFIRMED'), (waitlist_table, 'TENTATIVE'))
+                for r in table.find(username=username) for e in events_table.find(id=r['event_id'])]
+        rows.sort(key=lambda row: events_table.order_key(row[0]))
+        return render_feed(f'ClubHub: {username}', rows)
+    return feed_response(('user', username), build)
+
+
+@app.route('/clubs/<name>/calendar.ics')
+def club_calendar(name):
+    if not clubs_table.find(name=name):
+        return 'Not found', 404
+
+    def build():
+        events = sorted(events_table.find(club_name=name), key=events_table.order_key)
+        return render_feed(f'ClubHub: {name}', [(e, 'CONFIRMED') for e in events])
+    return feed_response(('club', name), build)
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--skip-invalid', is_flag=True, help='Import the valid rows even if some rows have errors.')
+def import_command(kind, path, skip_invalid):
+    with open(path, 'rb') as f:
+        imported, errors = import_rows(kind, read_rows(f, format_for(path)), 'admin', skip_invalid)
+    for line, msg in errors:
+        print(f"line {line}: {msg}")
+    print(f"Imported {imported} {kind}" + (f", {len(errors)} row(s) with errors" if errors else ""))
+    if errors and not imported:
+        raise SystemExit(1)
+
+
+@app.cli.command('archive')
+@click.option('--days', type=int, default=None, help='Archive events dated more than this many days ago.')
+def archive_command(days):
+    done = archive_past_events(days)
+    print(f"Archived {done['events']} event(s) dated before {done['cutoff']} and {done['registrations']} registration(s); "
+          f"purged registrations of {done['orphaned']} missing event(s)")
+
+
+@app.cli.command('migrate-sqlite')
+@click.argument('source', default='db.json')
+@click.argument('target', default='clubhub.sqlite3')
+def migrate_sqlite_command(source, target):
+    store = SQLiteDB(target)
+    if any(len(store.table(name)) for name in store.tables()):
+        raise click.ClickException(f"{target} already has data; remove it first")
+    counts = migrate_json(source, store)
+    store.close()
+    for name, n in sorted(counts.items()):
+        print(f"{name}: {n}")
+    print(f"Migrated {source} -> {target}. Run with CLUBHUB_STORAGE=sqlite to use it.")
+
+
+@app.cli.command('fetch-fonts')
+def fetch_fonts_command():
+    import re
+    import urllib.request
+    # Google serves woff2 only to browsers it recognises
+    ua = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+    os.makedirs(FONT_DIR, exist_ok=True)
+    for filename, (family, _, query) in FONT_FILES.items():
+        req = urllib.request.Request(f"https://fonts.googleapis.com/css2?family={query}&display=swap", headers={'User-Agent': ua})
+        css = urllib.request.urlopen(req, timeout=30).read().decode()
+        match = re.search(r'/\* latin \*/[^}]*?url\((https://[^)]+\.woff2)\)', css)
+        if not match:
+            raise click.ClickException(f"No latin woff2 face found for {family}")
+        with urllib.request.urlopen(match.group(1), timeout=30) as src, open(os.path.join(FONT_DIR, filename), 'wb') as dst:
+            dst.write(src.read())
+        print(f"{family}: static/fonts/{filename}")
+
+
 if __name__ == '__main__':
     initialize_system()
     app.run(debug=True)
\ No newline at end of file
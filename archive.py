@@ -0,0 +1,98 @@
+"""Cold storage for events that are over.
+
+The archive is a second database, opened with the same storage backend as
+the live one, holding ``events`` (each stamped with its final participant
+count and the day it was archived) and their ``registrations``. It is only
+opened when something first asks for it, so neither startup nor the live
+tables' writes pay for the archive's size. Waitlist rows are not kept:
+once an event is over, nobody is waiting for it any more.
+"""
+import datetime
+import threading
+from itertools import islice
+
+from indexes import IndexedTable
+from metrics import MeteredTable
+
+
+class Archive:
+    """``lock`` is held while the archive is first read; ``watchers(table)`` gives watchers for each table opened."""
+
+    def __init__(self, open_db, lock=None, watchers=None):
+        self._open_db = open_db
+        self._lock = lock or threading.Lock()
+        self._watchers = watchers
+        self._db = None
+
+    def _open(self):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    db = self._open_db()
+                    self.events = IndexedTable(MeteredTable(db.table('archived_events')), ['id', 'club_name'],
+                                               order_by='date', order_default='')
+                    self.registrations = IndexedTable(MeteredTable(db.table('archived_registrations')),
+                                                      ['event_id', 'username'])
+                    for table in (self.events, self.registrations):
+                        for watcher in self._watchers(table) if self._watchers else ():
+                            table.watch(watcher, replay=False)
+                    self._db = db
+        return self
+
+    @property
+    def db(self):
+        """The archive database if it has been opened, else None."""
+        return self._db
+
+    def tables(self):
+        return {t.name: t for t in (self.events, self.registrations)} if self._db is not None else {}
+
+    def __getattr__(self, name):
+        # events / registrations appear on first use
+        if name in ('events', 'registrations'):
+            return getattr(self._open(), name)
+        raise AttributeError(name)
+
+    def store(self, events, registrations, counts):
+        """Copy ``events`` and ``registrations`` in, skipping any already there from an interrupted run."""
+        self._open()
+        today = datetime.date.today().isoformat()
+        new_events = [dict(e, participants=counts.get(e['id'], 0), archived_on=today)
+                      for e in events if not self.events.find(id=e['id'])]
+        new_regs = [{'event_id': r['event_id'], 'username': r['username']} for r in registrations
+                    if not self.registrations.find(event_id=r['event_id'], username=r['username'])]
+        if new_events:
+            self.events.insert_multiple(new_events)
+        if new_regs:
+            self.registrations.insert_multiple(new_regs)
+        return len(new_events), len(new_regs)
+
+    def attended(self, username):
+        return {r['event_id'] for r in self.registrations.find(username=username)}
+
+    def page(self, club=None, event_ids=None, after=None, limit=30):
+        """Archived events newest first, optionally only ``club``'s or those in ``event_ids``.
+
+        Returns ``(events, more)``; ``after`` is an ``order_key`` to resume past.
+        """
+        self._open()
+        if club is None and event_ids is None:
+            it = self.events.ordered(after=after, reverse=True)
+        else:
+            docs = self.events.find(club_name=club) if club is not None else \
+                [doc for eid in event_ids for doc in self.events.find(id=eid)]
+            if club is not None and event_ids is not None:
+                docs = [doc for doc in docs if doc['id'] in event_ids]
+            docs.sort(key=self.events.order_key, reverse=True)
+            it = iter([doc for doc in docs if after is None or self.events.order_key(doc) < after])
+        page = list(islice(it, limit + 1))
+        return page[:limit], len(page) > limit
+
+    def clear(self):
+        self._open()
+        self.events.truncate()
+        self.registrations.truncate()
+
+    def close(self):
+        if self._db is not None and hasattr(self._db, 'close'):
+            self._db.close()
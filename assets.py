@@ -0,0 +1,54 @@
+"""Fingerprinted, precompressed static assets.
+
+Assets are registered once at startup; each gets a content-hashed filename
+(so it can be cached forever) and its gzip/brotli variants are built up front
+rather than per request. ``compress_body`` is the same negotiation applied to
+dynamic HTML responses.
+"""
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+# fingerprinted filename -> (mimetype, {encoding: bytes}, digest)
+assets = {}
+# logical name -> fingerprinted URL
+asset_urls = {}
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def add_asset(name, body, mimetype, compress=True, prefix='/assets/'):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    stem, ext = os.path.splitext(os.path.basename(name))
+    filename = f"{stem}.{digest}{ext}"
+    variants = {'identity': body}
+    if compress:
+        variants['gzip'] = gzip.compress(body, 9, mtime=0)
+        if brotli:
+            variants['br'] = brotli.compress(body)
+    assets[filename] = (mimetype, variants, digest)
+    asset_urls[name] = prefix + filename
+    return asset_urls[name]
+
+
+def pick_encoding(accept_encodings, available):
+    for encoding in ENCODINGS:
+        if encoding in available and accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, 6)
+    return body
@@ -0,0 +1,82 @@
+"""Cost of serving iCal feeds: a cold build, a cached hit, and a 304 poll.
+
+    python benchmarks/bench_calendar.py --events 5000 --registrations 50000 --runs 300
+
+Loads a generated database, then times /clubs/<name>/calendar.ics for the
+busiest club and /calendar/<user>.ics for the busiest user through the test
+client: rebuilt on every request (the cache dropped first), served from the
+cache, and polled with If-None-Match, which is what calendar apps do.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import quote
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+
+def timed(fn, runs, before=None):
+    fn()
+    samples = []
+    for _ in range(runs):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--clubs', type=int, default=100)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--registrations', type=int, default=50000)
+    parser.add_argument('--runs', type=int, default=300)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        with open(path, 'w') as f:
+            json.dump(generate(users=args.users, clubs=args.clubs, events=args.events,
+                               registrations=args.registrations), f)
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        import app
+
+        club, n_events = Counter(e['club_name'] for e in app.events_table).most_common(1)[0]
+        user, n_regs = Counter(r['username'] for r in app.registrations_table).most_common(1)[0]
+        client = app.app.test_client()
+        feeds = ((f'club ({n_events} events)', ('club', club), f'/clubs/{quote(club)}/calendar.ics'),
+                 (f'user ({n_regs} events)', ('user', user), f'/calendar/{user}.ics?token={app.calendar_token(user)}'))
+
+        print(f"{'feed':<22}{'request':<14}{'median us':>11}{'p99 us':>9}{'bytes':>9}")
+        for label, key, url in feeds:
+            resp = client.get(url)
+            etag, size = resp.headers['ETag'], len(resp.get_data())
+            for kind, fn, before in (
+                    ('rebuilt', lambda: client.get(url).get_data(), lambda: app.feed_cache.drop(key)),
+                    ('cached', lambda: client.get(url).get_data(), None),
+                    ('304 poll', lambda: client.get(url, headers={'If-None-Match': etag}).get_data(), None)):
+                median, p99 = timed(fn, args.runs, before)
+                print(f"{label:<22}{kind:<14}{median:11.1f}{p99:9.1f}{size if kind != '304 poll' else 0:9}")
+        app.password_pool.shutdown()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
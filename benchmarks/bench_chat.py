@@ -0,0 +1,81 @@
+"""Latency of chat answers over a large generated dataset.
+
+    python benchmarks/bench_chat.py --events 10000 --runs 200
+
+Loads a generated database with N events, then times ChatBot.answer() for
+date, type, club and title questions, and the full /chat round trip
+through the test client.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+QUESTIONS = (
+    "what's on this week?",
+    "anything on tomorrow?",
+    "workshops next month",
+    "chess club events",
+    "comedy this weekend",
+    "when is {title}?",
+    "jazz jam",
+    "what happened recently",
+    "how do I register?",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--clubs', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        with open(path, 'w') as f:
+            json.dump(generate(users=200, clubs=args.clubs, events=args.events, registrations=0), f)
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        import app
+
+        print(f"{len(app.events_table)} events, {len(app.clubs_table)} clubs, "
+              f"{len(app.event_words.postings)} distinct terms")
+        print(f"{'question':<36}{'median us':>11}{'p99 us':>9}  first line of answer")
+        title = app.events_table.by_id(42)['title']
+        questions = [q.format(title=title) for q in QUESTIONS]
+        for q in questions:
+            app.chat_bot.answer(q)
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                reply = app.chat_bot.answer(q)
+                samples.append((time.perf_counter() - start) * 1e6)
+            samples.sort()
+            print(f"{q:<36}{statistics.median(samples):11.1f}{samples[int(len(samples) * 0.99) - 1]:9.1f}  "
+                  f"{reply.splitlines()[0][:60]}")
+
+        client = app.app.test_client()
+        samples = []
+        for i in range(args.runs):
+            start = time.perf_counter()
+            client.post('/chat', json={'message': questions[i % len(questions)]}).get_json()
+            samples.append((time.perf_counter() - start) * 1e6)
+        print(f"{'POST /chat round trip':<36}{statistics.median(samples):11.1f}{sorted(samples)[int(len(samples) * 0.99) - 1]:9.1f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
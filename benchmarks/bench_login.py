@@ -0,0 +1,83 @@
+"""Login throughput against the number of hashing workers.
+
+    python benchmarks/bench_login.py --logins 200 --threads 32
+    python benchmarks/bench_login.py --workers 1 2 4 8
+
+For each worker count, fires concurrent logins through the app's /login
+route with the verified-credential cache disabled, so every request pays
+for one scrypt check, and reports logins per second. A final run with the
+cache enabled shows what repeat logins cost.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run(app, logins, threads):
+    local = threading.local()
+    codes = {}
+    lock = threading.Lock()
+
+    def login(i):
+        if getattr(local, 'client', None) is None:
+            local.client = app.app.test_client()
+        code = local.client.post('/login', data={'username': 'student', 'password': '123'}).status_code
+        local.client.get('/logout')
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(login, range(logins)))
+    return logins / (time.perf_counter() - start), codes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+')
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        with open(path, 'w') as f:
+            json.dump({}, f)
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        import app
+        from passwords import HashPool
+        app.initialize_system()
+
+        print(f"{cores} cores, {args.logins} logins from {args.threads} threads, method={app.password_pool.method}")
+        for n in workers:
+            app.password_pool.shutdown()
+            app.password_pool = HashPool(workers=n, max_pending=args.threads, method=app.password_pool.method, cache_ttl=0)
+            run(app, n, n)  # start the worker processes before timing
+            rate, codes = run(app, args.logins, args.threads)
+            print(f"workers={n:<3} {rate:8.1f} logins/s  {codes}")
+
+        app.password_pool.shutdown()
+        app.password_pool = HashPool(max_pending=args.threads, method=app.password_pool.method)
+        run(app, 1, 1)
+        rate, codes = run(app, args.logins, args.threads)
+        print(f"cached      {rate:8.1f} logins/s  {codes}")
+        app.password_pool.shutdown()
+        app.db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Time-to-first-byte and peak memory of the streamed events page.
+
+    python benchmarks/bench_render.py --events 5000 --runs 5
+
+Seeds a throwaway db.json with N events, renders them all on one page
+(CLUBHUB_EVENTS_PER_PAGE=N) and measures the response two ways: streamed,
+as a WSGI server sends it chunk by chunk, and buffered, the whole body
+joined in memory before the first byte leaves, which is what home() did
+before it streamed.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def seed(path, n):
+    today = datetime.date.today()
+    clubs = {str(i): {'name': f'Club {i}', 'description': 'd', 'leader': 'L', 'founded': '2023-01-01', 'created_by': 'admin'}
+             for i in range(1, 51)}
+    events = {}
+    for i in range(1, n + 1):
+        events[str(i)] = {
+            'id': str(uuid.uuid4()), 'title': f'Event {i}', 'club_name': f'Club {i % 50 + 1}', 'type': 'Workshop',
+            'date': (today + datetime.timedelta(days=i % 365 - 180)).isoformat(), 'location': f'Room {i % 40}',
+            'description': 'A generated event used to benchmark rendering of the events grid.', 'created_by': 'admin',
+        }
+    with open(path, 'w') as f:
+        json.dump({'clubs': clubs, 'events': events, 'users': {}, 'registrations': {}}, f)
+
+
+def measure(client, streamed):
+    tracemalloc.start()
+    start = time.perf_counter()
+    resp = client.get('/', buffered=False, headers={'Accept-Encoding': 'identity'})
+    body = iter(resp.response)
+    if streamed:
+        first = next(body)
+        ttfb = time.perf_counter() - start
+        size = len(first) + sum(len(chunk) for chunk in body)
+    else:
+        page = b''.join(c.encode() if isinstance(c, str) else c for c in body)
+        ttfb = time.perf_counter() - start
+        size = len(page)
+    total = time.perf_counter() - start
+    resp.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ttfb, total, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        seed(path, args.events)
+        os.environ['CLUBHUB_DB'] = path
+        os.environ['CLUBHUB_EVENTS_PER_PAGE'] = str(args.events)
+        sys.path.insert(0, ROOT)
+        import app
+
+        client = app.app.test_client()
+        for streamed in (True, False):
+            measure(client, streamed)  # warm the card cache and first-call allocations, as a running server would have them
+        for label, streamed in (('streamed', True), ('buffered', False)):
+            runs = [measure(client, streamed) for _ in range(args.runs)]
+            ttfb = statistics.median(r[0] for r in runs) * 1000
+            total = statistics.median(r[1] for r in runs) * 1000
+            peak = statistics.median(r[2] for r in runs) / 1024 / 1024
+            print(f"{label:<9} events={args.events}  ttfb={ttfb:8.2f} ms  total={total:8.2f} ms  "
+                  f"peak={peak:7.2f} MiB  bytes={runs[0][3]}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Per-route latency, throughput and memory, with a regression check.
+
+    python benchmarks/bench_routes.py --events 2000 --registrations 100000 --requests 200
+    python benchmarks/bench_routes.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_routes.py --baseline benchmarks/baseline.json --tolerance 1.5
+
+Generates a dataset with gen_dataset.py (or uses ``--db``), then drives the
+app through Flask's test client: every route below is requested anonymously,
+as a student and as an admin, sequentially, with the response body fully
+read. Reports p50/p95/p99 latency, requests per second and the process's
+peak RSS after each route. With ``--baseline``, exits non-zero if a route's
+p50 got more than ``--tolerance`` times slower than the stored value.
+Set CLUBHUB_STORAGE to benchmark another backend.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+ROLES = ('anon', 'student', 'admin')
+ROUTES = ('GET /', 'GET /clubs', 'POST /login', 'POST /register_event', 'POST /unregister', 'POST /chat')
+CHAT_MESSAGES = ('what events are on?', 'how do I join a club?', 'hello', 'when is the next hackathon?')
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_request(app, client, route, role, eids, rng):
+    if route == 'GET /':
+        return client.get('/')
+    if route == 'GET /clubs':
+        return client.get('/clubs')
+    if route == 'POST /login':
+        if role == 'anon':
+            return client.post('/login', data={'username': 'nobody', 'password': 'wrong'})
+        return client.post('/login', data={'username': role, 'password': '123'})
+    if route == 'POST /register_event':
+        return client.post(f'/register_event/{rng.choice(eids)}')
+    if route == 'POST /unregister':
+        return client.post(f'/unregister/{rng.choice(eids)}')
+    return client.post('/chat', json={'message': rng.choice(CHAT_MESSAGES)})
+
+
+def client_for(app, role):
+    client = app.app.test_client()
+    if role != 'anon':
+        # signed in directly, so only the login route itself pays for password hashing
+        with client.session_transaction() as s:
+            s['username'] = role
+            s['role'] = role
+    return client
+
+
+def bench(app, route, role, requests, warmup, eids, rng):
+    client = client_for(app, role)
+    samples = []
+    for i in range(warmup + requests):
+        start = time.perf_counter()
+        resp = make_request(app, client, route, role, eids, rng)
+        resp.get_data()
+        elapsed = time.perf_counter() - start
+        resp.close()
+        if route == 'POST /login' and role != 'anon':
+            client = client_for(app, role)
+        if i >= warmup:
+            samples.append(elapsed)
+    total = sum(samples)
+    samples.sort()
+    return {'p50': percentile(samples, 50) * 1000, 'p95': percentile(samples, 95) * 1000,
+            'p99': percentile(samples, 99) * 1000, 'rps': len(samples) / total if total else 0.0,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--clubs', type=int, default=50)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--registrations', type=int, default=20000)
+    parser.add_argument('--db', help='benchmark a copy of this db.json instead of a generated one')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per route and role')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--roles', nargs='+', choices=ROLES, default=list(ROLES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--save-baseline', help='write the p50s to this file as the new baseline')
+    parser.add_argument('--baseline', help='fail if a route is slower than this baseline allows')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed p50 slowdown factor (default 1.5)')
+    parser.add_argument('--slack-ms', type=float, default=1.0, help='slowdowns under this many ms never fail')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        if args.db:
+            shutil.copy(args.db, path)
+        else:
+            with open(path, 'w') as f:
+                json.dump(generate(args.users, args.clubs, args.events, args.registrations, args.seed), f)
+        if os.environ.get('CLUBHUB_STORAGE') == 'sqlite':
+            sys.path.insert(0, ROOT)
+            from sqlite_store import SQLiteDB, migrate_json
+            store = SQLiteDB(os.path.join(tmp, 'clubhub.sqlite3'))
+            migrate_json(path, store)
+            store.close()
+            path = os.path.join(tmp, 'clubhub.sqlite3')
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        start = time.perf_counter()
+        import app
+        print(f"storage={os.environ.get('CLUBHUB_STORAGE', 'json')}  events={len(app.events_table)}  "
+              f"users={len(app.users_table)}  registrations={len(app.registrations_table)}  "
+              f"startup={time.perf_counter() - start:.2f} s  rss={peak_rss_mb():.0f} MiB")
+
+        rng = random.Random(args.seed)
+        eids = [e['id'] for e in app.events_table if 'id' in e]
+        results = {}
+        print(f"{'route':<22}{'role':<9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'peak RSS':>10}")
+        for route in args.routes:
+            for role in args.roles:
+                r = results[f'{route} {role}'] = bench(app, route, role, args.requests, args.warmup, eids, rng)
+                print(f"{route:<22}{role:<9}{r['p50']:9.2f}{r['p95']:9.2f}{r['p99']:9.2f}{r['rps']:9.0f}"
+                      f"{r['peak_rss_mb']:8.0f} MiB")
+        app.password_pool.shutdown()
+        app.db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({key: round(r['p50'], 3) for key, r in results.items()}, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = [(key, baseline[key], r['p50']) for key, r in results.items()
+                  if key in baseline and r['p50'] > max(baseline[key] * args.tolerance, baseline[key] + args.slack_ms)]
+        for key, before, now in slower:
+            print(f"REGRESSION: {key} p50 {before:.2f} ms -> {now:.2f} ms")
+        if slower:
+            sys.exit(1)
+        print(f"no route slower than {args.tolerance}x its baseline p50")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Latency of search and type-ahead suggestions over a large generated dataset.
+
+    python benchmarks/bench_search.py --events 30000 --runs 300
+
+Loads a generated database with N events, then times TextIndex.suggest()
+for partial queries as they would be typed, TextIndex.search() for whole
+queries, and the /api/suggest and /search round trips through the test
+client.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+TYPED = ('w', 'wo', 'work', 'jazz j', 'chess cl', 'robotics ', 'open mic n', 'zzq')
+QUERIES = ('workshop', 'chess club', 'jazz night hall', 'robotics hackathon', 'zzq')
+
+
+def timed(fn, runs):
+    fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=30000)
+    parser.add_argument('--clubs', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=300)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        with open(path, 'w') as f:
+            json.dump(generate(users=200, clubs=args.clubs, events=args.events, registrations=0), f)
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        start = time.perf_counter()
+        import app
+        print(f"{len(app.events_table)} events, {len(app.clubs_table)} clubs, "
+              f"{len(app.event_words.postings)} distinct terms, startup {time.perf_counter() - start:.2f} s")
+
+        print(f"{'suggest':<24}{'median us':>11}{'p99 us':>9}  top suggestions")
+        for q in TYPED:
+            tokens = app.tokenize(q)
+            prefix = tokens.pop() if tokens and not q[-1:].isspace() else None
+            median, p99 = timed(lambda: app.event_words.suggest(tokens, prefix), args.runs)
+            top = [app.events_table.by_id(d)['title'] for d in app.event_words.suggest(tokens, prefix)[:3]]
+            print(f"{q!r:<24}{median:11.1f}{p99:9.1f}  {'; '.join(top)[:60]}")
+
+        print(f"{'search':<24}{'median us':>11}{'p99 us':>9}  hits")
+        for q in QUERIES:
+            terms = app.tokenize(q)
+            median, p99 = timed(lambda: app.event_words.search(terms, app.SEARCH_RESULTS), args.runs)
+            print(f"{q!r:<24}{median:11.1f}{p99:9.1f}  {len(app.event_words.search(terms, app.SEARCH_RESULTS))}")
+
+        client = app.app.test_client()
+        for label, url in (('GET /api/suggest', '/api/suggest?q=jazz%20j'), ('GET /search', '/search?q=chess+club')):
+            median, p99 = timed(lambda: client.get(url).get_data(), args.runs)
+            print(f"{label:<24}{median:11.1f}{p99:9.1f}")
+        app.password_pool.shutdown()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
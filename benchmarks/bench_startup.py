@@ -0,0 +1,75 @@
+"""Startup time on a large db.json, with and without pending migrations.
+
+    python benchmarks/bench_startup.py --events 20000 --registrations 200000 --legacy 0.2
+
+Generates a database, strips the id from a share of its unregistered
+events (as in databases from before events had ids), then imports the app
+in a fresh process three times: the first start migrates, the next two find the
+schema current. Each run reports the import time, the bytes written to
+disk and how many events still lack an id.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+CHILD = """
+import time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+from metrics import registry
+ids = [e.get('id') for e in app.events_table]
+print(elapsed, registry.value('clubhub_db_bytes_written_total'), sum(1 for i in ids if not i), len(ids) - len(set(ids)))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--clubs', type=int, default=200)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--registrations', type=int, default=200000)
+    parser.add_argument('--legacy', type=float, default=0.2, help='share of events stored without an id')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        data = generate(args.users, args.clubs, args.events, args.registrations, args.seed)
+        rng = random.Random(args.seed)
+        # events without an id could never be registered for, so only unregistered ones are stripped
+        taken = {r['event_id'] for table in ('registrations', 'waitlist') for r in data[table].values()}
+        stripped = 0
+        for doc in data['events'].values():
+            if doc['id'] not in taken and rng.random() < args.legacy:
+                doc.pop('id', None)
+                stripped += 1
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        print(f"db.json {os.path.getsize(path) / 2 ** 20:.1f} MiB, {args.events} events ({stripped} without an id), "
+              f"storage={os.environ.get('CLUBHUB_STORAGE', 'json')}")
+        env = dict(os.environ, CLUBHUB_DB=path)
+        print(f"{'start':<12}{'import s':>10}{'written':>14}{'no id':>8}{'dup ids':>9}")
+        for label in ('migrating', 'current', 'current'):
+            out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True,
+                                 capture_output=True, text=True).stdout.split('\n')
+            elapsed, written, missing, dups = out[-2].split()
+            print(f"{label:<12}{float(elapsed):10.2f}{int(float(written)):>12} B{int(missing):8}{int(dups):9}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
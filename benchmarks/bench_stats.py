@@ -0,0 +1,96 @@
+"""Cost of the admin stats as registration history grows.
+
+    python benchmarks/bench_stats.py --registrations 10000 100000 300000
+
+For each size, loads a generated database in a fresh process and times
+/api/stats and /stats as an admin, against working the same top lists out
+from the tables (registrations per club joined through each event, top
+events, active students, sign-ups per day) in one pass each, as the page
+would have to without the incremental counters. Also reports startup, which replays the
+tables into the counters once.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from gen_dataset import generate  # noqa: E402
+
+
+def timed(fn, runs):
+    fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def scan(app):
+    club_regs, event_regs, students, days = Counter(), Counter(), Counter(), Counter()
+    club_of = {e['id']: e['club_name'] for e in app.events_table.all()}
+    for r in app.registrations_table.all():
+        if r['event_id'] in club_of:
+            club_regs[club_of[r['event_id']]] += 1
+            event_regs[r['event_id']] += 1
+        students[r['username']] += 1
+        days[r.get('registered_on')] += 1
+    return club_regs.most_common(10), event_regs.most_common(10), students.most_common(10), len(days)
+
+
+def measure(path, runs, results):
+    os.environ['CLUBHUB_DB'] = path
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import app
+    startup = time.perf_counter() - start
+    client = app.app.test_client()
+    with client.session_transaction() as s:
+        s['username'] = 'admin'
+        s['role'] = 'admin'
+    api = timed(lambda: client.get('/api/stats').get_data(), runs)
+    page = timed(lambda: client.get('/stats').get_data(), runs)
+    full = timed(lambda: scan(app), max(1, runs // 20))
+    results.put((len(app.events_table), len(app.registrations_table), startup, api, page, full))
+    app.password_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--registrations', type=int, nargs='+', default=[10000, 100000, 300000])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=100)
+    args = parser.parse_args()
+    ctx = multiprocessing.get_context('fork')
+
+    print(f"{'events':>8}{'registrations':>15}{'startup s':>11}{'/api/stats ms':>15}{'/stats ms':>11}{'table scan ms':>15}")
+    for n in args.registrations:
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'db.json')
+            with open(path, 'w') as f:
+                json.dump(generate(users=args.users, clubs=100, events=args.events, registrations=n), f)
+            results = ctx.Queue()
+            proc = ctx.Process(target=measure, args=(path, args.runs, results))
+            proc.start()
+            events, regs, startup, api, page, full = results.get()
+            proc.join()
+        finally:
+            shutil.rmtree(tmp)
+        print(f"{events:8}{regs:15}{startup:11.2f}{api:15.2f}{page:11.2f}{full:15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Write latency of the default JSON storage vs LogStorage.
+
+    python benchmarks/bench_storage.py --sizes 10000,100000,1000000 --writes 20
+
+Each run seeds a db.json holding N registrations, then times single
+``registrations.insert`` calls the way reg_event() makes them.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tinydb import TinyDB  # noqa: E402
+from storage import LogDB  # noqa: E402
+
+
+def seed(path, n):
+    regs = {str(i): {'event_id': 'event-%d' % (i % 2000), 'username': 'user%d' % i} for i in range(1, n + 1)}
+    with open(path, 'w') as f:
+        json.dump({'registrations': regs}, f)
+
+
+def time_writes(db, writes):
+    table = db.table('registrations')
+    samples = []
+    for i in range(writes):
+        start = time.perf_counter()
+        table.insert({'event_id': 'event-bench', 'username': 'bench%d' % i})
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, n, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{name:<6} n={n:<9} median={statistics.median(samples) * 1000:9.2f} ms  "
+          f"p95={p95 * 1000:9.2f} ms  max={samples[-1] * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--no-fsync', action='store_true', help='skip fsync on log appends')
+    args = parser.parse_args()
+
+    for n in [int(x) for x in args.sizes.split(',')]:
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'db.json')
+            seed(path, n)
+            db = TinyDB(path)
+            report('json', n, time_writes(db, args.writes))
+            db.close()
+
+            seed(path, n)
+            start = time.perf_counter()
+            db = LogDB(path, fsync=not args.no_fsync)
+            print(f"log    n={n:<9} startup={(time.perf_counter() - start) * 1000:.0f} ms")
+            report('log', n, time_writes(db, args.writes))
+            db.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
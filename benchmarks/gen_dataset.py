@@ -0,0 +1,111 @@
+"""Generate a realistic db.json of any size.
+
+    python benchmarks/gen_dataset.py --users 20000 --clubs 200 --events 2000 --registrations 100000 -o big.json
+
+Clubs, events and registrations follow a rough long tail: a few popular
+clubs host most events and a few popular events draw most sign-ups. Event
+dates are spread over the year around today and sign-ups over the last four
+months, a tenth of events have a capacity (some of them full, with a
+waitlist), and every user, including the usual ``admin`` and ``student``,
+has the password ``123``.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from passwords import DEFAULT_METHOD  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+EVENT_TYPES = ('Competition', 'Comedy', 'Workshop', 'Social')
+TOPICS = ('Robotics', 'Chess', 'Film', 'Hiking', 'Debate', 'Jazz', 'Startup', 'Photography', 'Poetry', 'Climbing',
+          'Astronomy', 'Cooking', 'Esports', 'Theatre', 'Gardening', 'Salsa', 'Volunteering', 'Anime', 'Finance', 'Choir')
+KINDS = ('Club', 'Society', 'Collective', 'Union', 'Circle')
+NOUNS = ('Night', 'Meetup', 'Workshop', 'Showcase', 'Jam', 'Tournament', 'Social', 'Talk', 'Trip', 'Hackathon')
+PLACES = ('Eng Block A', 'Library Hall', 'Main Auditorium', 'Student Union', 'Lab 1', 'Sports Centre', 'Quad', 'Room 204')
+
+
+def weighted_pick(rng, items, skew=1.2):
+    # Zipf-like: item k is picked with weight 1 / (k + 1) ** skew
+    weights = [1 / (k + 1) ** skew for k in range(len(items))]
+    return lambda n: rng.choices(items, weights, k=n)
+
+
+def generate(users=1000, clubs=20, events=200, registrations=5000, seed=0, method=DEFAULT_METHOD):
+    """Return the database as TinyDB's on-disk dict, ``{table: {doc_id: doc}}``."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    password = generate_password_hash('123', method)
+
+    usernames = ['admin', 'student'] + [f'user{i}' for i in range(1, users - 1)]
+    user_rows = {str(i): {'username': u, 'password': password, 'role': 'admin' if u == 'admin' or i % 200 == 0 else 'student'}
+                 for i, u in enumerate(usernames[:max(users, 2)], 1)}
+
+    names = [f'{TOPICS[i % len(TOPICS)]} {KINDS[i // len(TOPICS) % len(KINDS)]}' + (f' {i // 100 + 1}' if i >= 100 else '')
+             for i in range(clubs)]
+    club_rows = {str(i): {'name': name, 'description': f'Everything {name.split()[0].lower()}, every week.',
+                          'leader': rng.choice(usernames), 'created_by': 'admin',
+                          'founded': (today - datetime.timedelta(days=rng.randint(30, 3000))).isoformat()}
+                 for i, name in enumerate(names, 1)}
+
+    host = weighted_pick(rng, names)
+    event_rows = {}
+    for i, club in enumerate(host(events), 1):
+        event_rows[str(i)] = {
+            'id': str(uuid.UUID(int=rng.getrandbits(128))), 'title': f'{club.split()[0]} {rng.choice(NOUNS)} #{i}',
+            'club_name': club, 'type': rng.choice(EVENT_TYPES),
+            'date': (today + datetime.timedelta(days=rng.randint(-180, 180))).isoformat(),
+            'location': rng.choice(PLACES), 'description': 'Bring a friend. Snacks provided.', 'created_by': 'admin',
+        }
+
+    reg_rows, wait_rows, pairs = {}, {}, set()
+    eids = [e['id'] for e in event_rows.values()]
+    if eids and users:
+        pick_event = weighted_pick(rng, eids, skew=0.8)
+        registrations = min(registrations, len(eids) * len(usernames))
+        while len(pairs) < registrations:
+            for eid in pick_event(registrations - len(pairs)):
+                pairs.add((eid, rng.choice(usernames)))
+    counts = {}
+    # sign-up days come from their own generator, so the rest of a seeded dataset is unchanged
+    signed_up = random.Random(seed + 1)
+    for n, (eid, user) in enumerate(sorted(pairs), 1):
+        day = today - datetime.timedelta(days=signed_up.randint(0, 120))
+        reg_rows[str(n)] = {'event_id': eid, 'username': user, 'registered_on': day.isoformat()}
+        counts[eid] = counts.get(eid, 0) + 1
+
+    for e in event_rows.values():
+        if rng.random() < 0.1:
+            e['capacity'] = counts.get(e['id'], 0) + rng.choice((0, 0, 5, 20))
+            e['waitlist'] = rng.choice((0, 10, 50))
+            if e['capacity'] == counts.get(e['id'], 0) and e['waitlist']:
+                for user in rng.sample(usernames, min(e['waitlist'] // 2, len(usernames))):
+                    if (e['id'], user) not in pairs:
+                        wait_rows[str(len(wait_rows) + 1)] = {'event_id': e['id'], 'username': user}
+
+    return {'users': user_rows, 'clubs': club_rows, 'events': event_rows,
+            'registrations': reg_rows, 'waitlist': wait_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--clubs', type=int, default=20)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--registrations', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='db.json')
+    args = parser.parse_args()
+    data = generate(args.users, args.clubs, args.events, args.registrations, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(data, f)
+    print(', '.join(f'{len(rows)} {name}' for name, rows in data.items()) + f' -> {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Live count stream under thousands of idle listeners.
+
+    python benchmarks/stress_live.py --clients 3000 --publishes 30
+    python benchmarks/stress_live.py --clients 2000 --workers 2
+
+Starts the app in one or more worker processes behind werkzeug's threaded
+server, sharing a throwaway database, and connects N clients to
+/live/counts (spread over the workers) from a single-threaded selector loop.
+Reports each worker's memory and thread count before and after the clients
+connect. Then registers a new user for an event, one POST at a time against
+the first worker, and times how long each client takes to see the new
+count: other workers learn about the write from the change journal, so
+their clients wait up to CLUBHUB_LIVE_SYNC_MS longer. The client loop
+shares the machine with the server, so the latencies include its own
+parsing. Exits non-zero if any client misses a count or drops its stream.
+"""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import os
+import selectors
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+from stress_workers import prepare  # noqa: E402
+
+EVENT = 'rush'
+
+
+def serve(path, users, results):
+    os.environ['CLUBHUB_DB'] = path
+    sys.path.insert(0, ROOT)
+    import app
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    # the default backlog of 128 overflows when thousands of clients connect at once
+    server.socket.listen(4096)
+    sign = app.app.session_interface.get_signing_serializer(app.app)
+    cookies = [f"{app.app.config['SESSION_COOKIE_NAME']}={sign.dumps({'username': u, 'role': 'student'})}" for u in users]
+    results.put((server.server_port, os.getpid(), cookies))
+    server.serve_forever()
+
+
+def proc_status(pid):
+    with open(f'/proc/{pid}/status') as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return int(fields['VmRSS'].split()[0]), int(fields['Threads'])
+
+
+def connect(port):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f'GET /live/counts?events={EVENT} HTTP/1.0\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n'.encode())
+    sock.setblocking(False)
+    return sock
+
+
+def pump(sel, bufs, socks, until, timeout):
+    """Read whatever any client has until ``until(buf)`` has held for each of ``socks``; returns arrival times."""
+    waiting = set(socks)
+    arrived, deadline = {}, time.perf_counter() + timeout
+    for sock in list(waiting):
+        if until(bufs[sock]):
+            arrived[sock] = time.perf_counter()
+            waiting.discard(sock)
+    while waiting and time.perf_counter() < deadline:
+        for key, _ in sel.select(0.05):
+            sock = key.fileobj
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                raise SystemExit(f'a client lost its stream ({len(waiting)} still waiting)')
+            bufs[sock] += data
+            if sock in waiting and until(bufs[sock]):
+                arrived[sock] = time.perf_counter()
+                waiting.discard(sock)
+    return arrived, waiting
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--publishes', type=int, default=30)
+    parser.add_argument('--batch', type=int, default=200, help='clients connected at a time')
+    args = parser.parse_args()
+    ctx = multiprocessing.get_context('fork')
+
+    tmp = tempfile.mkdtemp()
+    procs = []
+    try:
+        path = prepare(tmp, 100, 50)
+        users = [f'live{i}' for i in range(args.publishes)]
+        results = ctx.Queue()
+        for _ in range(args.workers):
+            procs.append(ctx.Process(target=serve, args=(path, users, results), daemon=True))
+            procs[-1].start()
+        workers = [results.get(timeout=60) for _ in procs]
+        for port, _, _ in workers:
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+        before = [proc_status(pid) for _, pid, _ in workers]
+
+        sel = selectors.DefaultSelector()
+        bufs, worker_of = {}, {}
+        start = time.perf_counter()
+        for i in range(0, args.clients, args.batch):
+            batch = []
+            for j in range(i, min(i + args.batch, args.clients)):
+                sock = connect(workers[j % len(workers)][0])
+                sel.register(sock, selectors.EVENT_READ)
+                batch.append(sock)
+                bufs[sock] = bytearray()
+                worker_of[sock] = j % len(workers)
+            _, waiting = pump(sel, bufs, batch, lambda buf: b'retry:' in buf, 30)
+            if waiting:
+                raise SystemExit(f'{len(waiting)} clients never got the stream preamble')
+        connected = time.perf_counter() - start
+        after = [proc_status(pid) for _, pid, _ in workers]
+
+        print(f"clients={args.clients}  workers={args.workers}  cores={os.cpu_count()}  connected in {connected:.1f} s")
+        print(f"{'worker':>6}{'clients':>9}{'RSS before MB':>15}{'RSS after MB':>14}{'KB/client':>11}{'threads':>9}")
+        for w, ((rss0, _), (rss1, threads)) in enumerate(zip(before, after)):
+            n = sum(1 for v in worker_of.values() if v == w)
+            print(f"{w:6}{n:9}{rss0 / 1024:15.1f}{rss1 / 1024:14.1f}{(rss1 - rss0) / max(n, 1):11.1f}{threads:9}")
+
+        port, _, cookies = workers[0]
+        poster = http.client.HTTPConnection('127.0.0.1', port)
+        latencies = [[] for _ in workers]
+        spreads, missed = [], 0
+        for k, cookie in enumerate(cookies, 1):
+            for sock in bufs:
+                del bufs[sock][:]
+            marker = b'"%s":%d}' % (EVENT.encode(), k)
+            sent = time.perf_counter()
+            poster.request('POST', f'/register_event/{EVENT}', headers={'Cookie': cookie, 'Accept': 'application/json'})
+            poster.getresponse().read()
+            arrived, waiting = pump(sel, bufs, bufs, lambda buf: marker in buf, 10)
+            missed += len(waiting)
+            for sock, t in arrived.items():
+                latencies[worker_of[sock]].append((t - sent) * 1000)
+            if arrived:
+                spreads.append((max(arrived.values()) - sent) * 1000)
+        poster.close()
+
+        print(f"{args.publishes} counts published; delivery latency from the POST being sent, in ms:")
+        print(f"{'worker':>6}{'p50':>9}{'p99':>9}{'max':>9}")
+        for w, values in enumerate(latencies):
+            values.sort()
+            if values:
+                print(f"{w:6}{pct(values, 0.5):9.1f}{pct(values, 0.99):9.1f}{values[-1]:9.1f}")
+        if spreads:
+            print(f"time until every client had a count: median {statistics.median(spreads):.1f} ms, max {max(spreads):.1f} ms")
+        for sock in bufs:
+            sock.close()
+        if missed:
+            print(f"FAIL: {missed} deliveries missed")
+            sys.exit(1)
+        print('OK')
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
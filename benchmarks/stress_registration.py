@@ -0,0 +1,154 @@
+"""Concurrent registration stress test.
+
+    python benchmarks/stress_registration.py --users 2000 --threads 64
+    CLUBHUB_STORAGE=log python benchmarks/stress_registration.py
+
+Fires register/unregister POSTs from many threads at a throwaway database
+while ``--readers`` more threads keep loading /clubs, and then checks the
+invariants: every page load succeeded, the database file still parses, no
+duplicate (event, user) rows, nothing lost, counters match the table, and
+a capped event never exceeds its capacity or waitlist. Reports sustained requests per second. Exits
+non-zero if any check fails.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def seed(path, capacity, waitlist):
+    events = {
+        '1': {'id': 'rush', 'title': 'Mega Hackathon', 'club_name': 'Campus Tech', 'type': 'Competition',
+              'date': '2030-01-01', 'location': 'Eng Block A', 'description': 'rush', 'created_by': 'admin'},
+        '2': {'id': 'capped', 'title': 'Small Workshop', 'club_name': 'Campus Tech', 'type': 'Workshop',
+              'date': '2030-01-02', 'location': 'Lab 1', 'description': 'capped', 'created_by': 'admin',
+              'capacity': capacity, 'waitlist': waitlist},
+    }
+    clubs = {'1': {'name': 'Campus Tech', 'description': 'd', 'leader': 'L', 'founded': '2023-01-01', 'created_by': 'admin'}}
+    with open(path, 'w') as f:
+        json.dump({'events': events, 'clubs': clubs, 'users': {}, 'registrations': {}}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--waitlist', type=int, default=50)
+    parser.add_argument('--readers', type=int, default=4, help='threads loading /clubs during the run')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'db.json')
+        seed(path, args.capacity, args.waitlist)
+        if os.environ.get('CLUBHUB_STORAGE') == 'sqlite':
+            sys.path.insert(0, ROOT)
+            from sqlite_store import SQLiteDB, migrate_json
+            sqlite_path = os.path.join(tmp, 'clubhub.sqlite3')
+            store = SQLiteDB(sqlite_path)
+            migrate_json(path, store)
+            store.close()
+            path = sqlite_path
+        os.environ['CLUBHUB_DB'] = path
+        sys.path.insert(0, ROOT)
+        import app
+
+        local = threading.local()
+
+        def client_for(user):
+            # a test client per thread; the session is set directly so no password hashing is involved
+            if getattr(local, 'client', None) is None:
+                local.client = app.app.test_client()
+            with local.client.session_transaction() as s:
+                s['username'] = user
+                s['role'] = 'student'
+            return local.client
+
+        # every user registers for both events, a random tenth click twice,
+        # and a random tenth then unregister from the rush event
+        users = [f'student{i}' for i in range(args.users)]
+        leavers = set(random.sample(users, args.users // 10))
+        jobs = [(u, f'/register_event/{eid}') for u in users for eid in ('rush', 'capped')]
+        jobs += [(u, '/register_event/rush') for u in random.sample(users, args.users // 10)]
+        random.shuffle(jobs)
+
+        def run(job):
+            user, url = job
+            assert client_for(user).post(url).status_code == 302
+
+        def leave(user):
+            assert client_for(user).post('/unregister/rush').status_code == 302
+
+        done = threading.Event()
+        reads = Counter()
+
+        def read():
+            client = app.app.test_client()
+            while not done.is_set():
+                resp = client.get('/clubs')
+                resp.get_data()
+                reads[resp.status_code] += 1
+
+        readers = [threading.Thread(target=read) for _ in range(args.readers)]
+        for t in readers:
+            t.start()
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(args.threads) as pool:
+                list(pool.map(run, jobs))
+                list(pool.map(leave, leavers))
+        finally:
+            done.set()
+            for t in readers:
+                t.join()
+        elapsed = time.perf_counter() - start
+        requests = len(jobs) + len(leavers)
+
+        failures = []
+        if set(reads) - {200}:
+            failures.append(f"/clubs answered {dict(reads)} while registrations were written")
+        if os.environ.get('CLUBHUB_STORAGE', 'json') == 'json':
+            try:
+                with open(path) as f:
+                    json.load(f)
+            except ValueError as exc:
+                failures.append(f"db.json no longer parses: {exc}")
+        regs = [(r['event_id'], r['username']) for r in app.registrations_table.table.all()]
+        waits = [(r['event_id'], r['username']) for r in app.waitlist_table.table.all()]
+        dupes = [k for k, n in Counter(regs + waits).items() if n > 1]
+        if dupes:
+            failures.append(f"{len(dupes)} duplicate rows, e.g. {dupes[:3]}")
+        rush = {u for e, u in regs if e == 'rush'}
+        if rush != set(users) - leavers:
+            failures.append(f"rush event has {len(rush)} registrations, expected {len(users) - len(leavers)}")
+        capped = sum(1 for e, _ in regs if e == 'capped')
+        waiting = sum(1 for e, _ in waits if e == 'capped')
+        if capped != min(args.capacity, args.users) or waiting != min(args.waitlist, max(args.users - args.capacity, 0)):
+            failures.append(f"capped event has {capped} registered / {waiting} waitlisted")
+        if app.check_participant_counts():
+            failures.append(f"counter mismatches: {app.check_participant_counts()}")
+
+        print(f"{requests} requests from {args.threads} threads in {elapsed:.2f} s = {requests / elapsed:.0f} req/s "
+              f"(storage={os.environ.get('CLUBHUB_STORAGE', 'json')})")
+        print(f"/clubs loaded {sum(reads.values())} times by {args.readers} readers meanwhile")
+        print(f"rush: {len(rush)} registered; capped: {capped} registered, {waiting} waitlisted")
+        for f in failures:
+            print('FAIL:', f)
+        app.db.close()
+        sys.exit(1 if failures else 0)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
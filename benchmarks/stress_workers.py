@@ -0,0 +1,192 @@
+"""Multi-process stress test: several app workers sharing one database.
+
+    python benchmarks/stress_workers.py --workers 1 2 4 --users 500
+    CLUBHUB_STORAGE=log python benchmarks/stress_workers.py --compact-bytes 1024
+
+For each worker count, starts that many processes that each import the app
+on their own (as gunicorn workers do without --preload) against the same
+throwaway database, and has them serve their share of a fixed load from a
+few threads each: every user registers for the open event and the capped
+event, a tenth of them unregister from the open event, and home page views
+are interleaved. Then checks that nothing was lost or duplicated and
+capacity held across processes, that every worker's in-memory view agrees
+with the database after a sync, and that a freshly started process reads
+the same. Under the log backend the log is compacted at ``--compact-bytes``,
+so workers swap it out under each other many times a run. Reports requests
+per second per worker count; exits non-zero if any check fails.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stress_registration import seed  # noqa: E402
+
+
+def prepare(tmp, capacity, waitlist):
+    path = os.path.join(tmp, 'db.json')
+    seed(path, capacity, waitlist)
+    if os.environ.get('CLUBHUB_STORAGE') == 'sqlite':
+        sys.path.insert(0, ROOT)
+        from sqlite_store import SQLiteDB, migrate_json
+        sqlite_path = os.path.join(tmp, 'clubhub.sqlite3')
+        store = SQLiteDB(sqlite_path)
+        migrate_json(path, store)
+        store.close()
+        path = sqlite_path
+    return path
+
+
+def state(app):
+    regs = [(r['event_id'], r['username']) for r in app.registrations_table]
+    waits = [(r['event_id'], r['username']) for r in app.waitlist_table]
+    return {'regs': sorted(regs), 'waits': sorted(waits), 'counts': dict(app.participant_counts)}
+
+
+def worker(path, jobs, leavers, threads, ready, go, results):
+    os.environ['CLUBHUB_DB'] = path
+    sys.path.insert(0, ROOT)
+    import app
+
+    local = threading.local()
+
+    def client_for(user):
+        # the session is set directly so no password hashing is involved
+        if getattr(local, 'client', None) is None:
+            local.client = app.app.test_client()
+        with local.client.session_transaction() as s:
+            s['username'] = user
+            s['role'] = 'student'
+        return local.client
+
+    def run(job):
+        user, method, url = job
+        resp = client_for(user).open(url, method=method)
+        resp.get_data()
+        return resp.status_code
+
+    ready.wait()
+    go.wait()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        statuses = Counter(pool.map(run, jobs))
+        statuses.update(pool.map(run, [(u, 'POST', '/unregister/rush') for u in leavers]))
+    elapsed = time.perf_counter() - start
+    # wait for every worker to finish writing, then compare this worker's view with everyone else's
+    ready.wait()
+    app.db_lock.sync()
+    results.put({'pid': os.getpid(), 'elapsed': elapsed, 'statuses': dict(statuses), 'state': state(app)})
+    app.password_pool.shutdown()
+
+
+def fresh_state(path, results):
+    os.environ['CLUBHUB_DB'] = path
+    sys.path.insert(0, ROOT)
+    import app
+    results.put(state(app))
+    app.password_pool.shutdown()
+
+
+def make_jobs(users, reads, rng):
+    jobs = [(u, 'POST', f'/register_event/{eid}') for u in users for eid in ('rush', 'capped')]
+    jobs += [(u, 'GET', '/') for u in users for _ in range(reads)]
+    rng.shuffle(jobs)
+    # the leavers unregister once all of their worker's registrations are in
+    return jobs, rng.sample(users, len(users) // 10)
+
+
+def run_once(workers, args, ctx):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = prepare(tmp, args.capacity, args.waitlist)
+        rng = random.Random(args.seed)
+        users = [f'student{i}' for i in range(args.users)]
+        shares = [users[i::workers] for i in range(workers)]
+        ready, go, results = ctx.Barrier(workers + 1), ctx.Barrier(workers + 1), ctx.Queue()
+        leavers, procs = set(), []
+        for share in shares:
+            jobs, leaving = make_jobs(share, args.reads, rng)
+            leavers.update(leaving)
+            procs.append(ctx.Process(target=worker, args=(path, jobs, leaving, args.threads, ready, go, results)))
+        for p in procs:
+            p.start()
+        ready.wait()
+        start = time.perf_counter()
+        go.wait()
+        ready.wait()
+        wall = time.perf_counter() - start
+        reports = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        checker = ctx.Process(target=fresh_state, args=(path, results))
+        checker.start()
+        on_disk = results.get()
+        checker.join()
+    finally:
+        shutil.rmtree(tmp)
+
+    requests = sum(sum(r['statuses'].values()) for r in reports)
+    failures = []
+    bad = {code: n for r in reports for code, n in r['statuses'].items() if code not in (200, 302, 304)}
+    if bad:
+        failures.append(f"unexpected statuses {bad}")
+    regs, waits = on_disk['regs'], on_disk['waits']
+    dupes = [k for k, n in Counter(regs + waits).items() if n > 1]
+    if dupes:
+        failures.append(f"{len(dupes)} duplicate rows, e.g. {dupes[:3]}")
+    rush = {u for e, u in regs if e == 'rush'}
+    if rush != set(users) - leavers:
+        failures.append(f"rush event has {len(rush)} registrations, expected {len(users) - len(leavers)} "
+                        f"({len(set(users) - leavers - rush)} lost)")
+    capped = sum(1 for e, _ in regs if e == 'capped')
+    waiting = sum(1 for e, _ in waits if e == 'capped')
+    if capped != min(args.capacity, args.users) or waiting != min(args.waitlist, max(args.users - args.capacity, 0)):
+        failures.append(f"capped event has {capped} registered / {waiting} waitlisted")
+    expected_counts = dict(Counter(e for e, _ in regs))
+    if on_disk['counts'] != expected_counts:
+        failures.append("participant counts of a fresh process don't match its registrations")
+    for r in reports:
+        if r['state'] != on_disk:
+            failures.append(f"worker {r['pid']}'s view differs from the database after sync")
+    return requests, wall, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='request threads per worker')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--reads', type=int, default=2, help='home page views per user')
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--waitlist', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compact-bytes', type=int, default=4096,
+                        help='log backend: compact at this size, so workers compact under each other many times a run')
+    args = parser.parse_args()
+    os.environ['CLUBHUB_LOG_COMPACT_BYTES'] = str(args.compact_bytes)
+    ctx = multiprocessing.get_context('fork')
+
+    print(f"storage={os.environ.get('CLUBHUB_STORAGE', 'json')}  users={args.users}  cores={os.cpu_count()}")
+    print(f"{'workers':>8}{'requests':>10}{'seconds':>9}{'req/s':>8}  result")
+    failed = False
+    for n in args.workers:
+        requests, wall, failures = run_once(n, args, ctx)
+        print(f"{n:8}{requests:10}{wall:9.2f}{requests / wall:8.0f}  {'OK' if not failures else 'FAIL'}")
+        for f in failures:
+            print('    FAIL:', f)
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
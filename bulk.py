@@ -0,0 +1,152 @@
+"""Bulk import parsing and streaming export formatting.
+
+``read_rows`` reads an uploaded CSV or JSONL file one line at a time and
+``clean_row`` checks a single row on its own terms (required fields, dates,
+numbers); checks against the database live with the import in app.py.
+``export_lines`` goes the other way, formatting documents lazily so an
+export is sent while it is still being read.
+"""
+import csv
+import datetime
+import io
+import json
+
+
+FORMATS = ('csv', 'jsonl')
+
+# the columns each kind is exported with, and the ones an import may set
+FIELDS = {
+    'clubs': ('name', 'description', 'leader', 'founded'),
+    'events': ('id', 'title', 'club_name', 'type', 'date', 'location', 'description', 'capacity', 'waitlist'),
+    'users': ('username', 'role'),
+    'registrations': ('event_id', 'username'),
+}
+REGISTRATION_EXPORT_FIELDS = ('event_id', 'title', 'date', 'username', 'status')
+
+EVENT_TYPES = ('Competition', 'Comedy', 'Workshop', 'Social')
+ROLES = ('student', 'admin')
+
+
+class RowError(ValueError):
+    """A row that can't be imported; the message is shown next to its line number."""
+
+
+def format_for(filename, default='csv'):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(ext, default)
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line, row, error)`` for each record of a binary CSV or JSONL stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, row, 'more values than columns'
+            else:
+                yield reader.line_num, row, None
+        return
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as exc:
+            yield line, None, f'invalid JSON: {exc}'
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, 'expected a JSON object'
+
+
+def _text(row, field, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{field} is required')
+    return value
+
+
+def _date(row, field, required=False):
+    value = _text(row, field, required)
+    if value:
+        try:
+            datetime.date.fromisoformat(value)
+        except ValueError:
+            raise RowError(f'{field} must be a YYYY-MM-DD date, got {value!r}')
+    return value
+
+
+def _count(row, field):
+    value = _text(row, field)
+    if not value:
+        return None
+    try:
+        n = int(value)
+    except ValueError:
+        raise RowError(f'{field} must be a whole number, got {value!r}')
+    if n < 0:
+        raise RowError(f'{field} must not be negative')
+    return n
+
+
+def clean_row(kind, row):
+    """Return the document ``row`` describes, without any database checks, or raise RowError."""
+    if kind == 'clubs':
+        return {'name': _text(row, 'name', True), 'description': _text(row, 'description'),
+                'leader': _text(row, 'leader', True),
+                'founded': _date(row, 'founded') or str(datetime.date.today())}
+    if kind == 'events':
+        doc = {'id': _text(row, 'id'), 'title': _text(row, 'title', True),
+               'club_name': _text(row, 'club_name', True), 'type': _text(row, 'type', True),
+               'date': _date(row, 'date', True), 'location': _text(row, 'location', True),
+               'description': _text(row, 'description')}
+        if doc['type'] not in EVENT_TYPES:
+            raise RowError(f"type must be one of {', '.join(EVENT_TYPES)}")
+        for field in ('capacity', 'waitlist'):
+            n = _count(row, field)
+            if n is not None:
+                doc[field] = n
+        return doc
+    if kind == 'users':
+        doc = {'username': _text(row, 'username', True), 'role': _text(row, 'role') or 'student'}
+        if doc['role'] not in ROLES:
+            raise RowError(f"role must be one of {', '.join(ROLES)}")
+        password_hash = _text(row, 'password_hash')
+        if password_hash:
+            if password_hash.count('$') != 2:
+                raise RowError('password_hash is not a werkzeug password hash')
+            doc['password'] = password_hash
+        else:
+            # left for the import to hash in bulk once the row has passed every check
+            doc['password_plain'] = _text(row, 'password', True)
+        return doc
+    if kind == 'registrations':
+        return {'event_id': _text(row, 'event_id', True), 'username': _text(row, 'username', True)}
+    raise ValueError(f'unknown import kind {kind!r}')
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_lines(docs, fields, fmt, chunk_size=64 * 1024):
+    """Yield ``docs`` as CSV (with a header) or JSONL, batched into chunks of about ``chunk_size`` bytes."""
+    chunk, size = [], 0
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        lines = (writer.writerow(['' if doc.get(f) is None else doc.get(f) for f in fields]) for doc in docs)
+        chunk, size = [writer.writerow(fields)], 0
+    else:
+        lines = (json.dumps({f: doc.get(f) for f in fields}) + '\n' for doc in docs)
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
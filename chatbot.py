@@ -0,0 +1,227 @@
+"""Chat answers drawn from the live events and clubs.
+
+``ChatBot.answer()`` picks a date window, an event type, a club and any
+remaining words out of a question, then answers from the date-ordered event
+list and the text indexes without scanning the events table. Questions that
+carry none of those get the canned help replies.
+"""
+import datetime
+import re
+from itertools import islice
+
+from bulk import EVENT_TYPES
+from textindex import facet, tokenize
+
+
+MAX_RESULTS = 5
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MONTHS = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december')
+MONTH_NAMES = {**{m: i for i, m in enumerate(MONTHS, 1)}, **{m[:3]: i for i, m in enumerate(MONTHS, 1)}, 'sept': 9}
+UPCOMING_WORDS = {'upcoming', 'soon', 'future', 'next', 'later'}
+# the types events can have, so asking for one that no event has yet says so instead of being ignored
+TYPE_WORDS = frozenset(t.lower() for t in EVENT_TYPES)
+PAST_WORDS = {'past', 'previous', 'earlier', 'recent', 'recently', 'ago'}
+HELP_WORDS = {'register', 'registration', 'join', 'signup', 'sign', 'host', 'create', 'organise', 'organize', 'login', 'log',
+              'account', 'help'}
+STOPWORDS = frozenset("""
+    a about all an and any anything are at be by can club clubs coming do does event events for from going happen
+    happened happening happens have hello hey hi how i im in is it its me my of on or please s show tell thanks that
+    the their there these this to up us was we what whats when where which who will with you your
+""".split())
+ISO_DATE_RE = re.compile(r'\b(\d{4}-\d{2}-\d{2})\b')
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _day(d):
+    return f"{d:%a} {d.day} {d:%b}"
+
+
+def date_window(message, tokens, today):
+    """Return ``(start, stop, reverse, label, words_used)`` for the dates a question mentions, or None."""
+    words = set(tokens)
+    match = ISO_DATE_RE.search(message)
+    if match and _date(match.group(1)):
+        d = _date(match.group(1))
+        return d, d + datetime.timedelta(1), False, f"on {_day(d)}", set(tokenize(match.group(1)))
+    if words & {'today', 'tonight'}:
+        return today, today + datetime.timedelta(1), False, "today", {'today', 'tonight'}
+    if 'tomorrow' in words:
+        d = today + datetime.timedelta(1)
+        return d, d + datetime.timedelta(1), False, "tomorrow", {'tomorrow'}
+    nxt = 'next' in words
+    monday = today - datetime.timedelta(today.weekday())
+    if 'weekend' in words:
+        saturday = monday + datetime.timedelta(5 + (7 if nxt else 0))
+        start = max(today, saturday)
+        return start, saturday + datetime.timedelta(2), False, "next weekend" if nxt else "this weekend", {'weekend', 'next'}
+    if 'week' in words:
+        if nxt:
+            return monday + datetime.timedelta(7), monday + datetime.timedelta(14), False, "next week", {'week', 'next'}
+        if 'last' in words:
+            return monday - datetime.timedelta(7), monday, True, "last week", {'week', 'last'}
+        return today, today + datetime.timedelta(7), False, "this week", {'week'}
+    if 'month' in words:
+        first_next = (today.replace(day=1) + datetime.timedelta(32)).replace(day=1)
+        if nxt:
+            after = (first_next + datetime.timedelta(32)).replace(day=1)
+            return first_next, after, False, "next month", {'month', 'next'}
+        return today, first_next, False, "this month", {'month'}
+    for i, token in enumerate(tokens):
+        if token in MONTH_NAMES and not (token == 'may' and i == 0):
+            month = MONTH_NAMES[token]
+            year = today.year if month >= today.month else today.year + 1
+            first = datetime.date(year, month, 1)
+            day = next((int(t) for t in tokens[max(0, i - 1):i + 2] if t.isdigit() and 1 <= int(t) <= 31), None)
+            if day:
+                try:
+                    d = first.replace(day=day)
+                except ValueError:
+                    d = None
+                if d:
+                    return d, d + datetime.timedelta(1), False, f"on {_day(d)}", {token, str(day)}
+            after = (first + datetime.timedelta(32)).replace(day=1)
+            return first, after, False, f"in {first:%B}", {token}
+        if token in WEEKDAYS:
+            d = today + datetime.timedelta((WEEKDAYS.index(token) - today.weekday()) % 7)
+            if nxt and d == today:
+                d += datetime.timedelta(7)
+            return d, d + datetime.timedelta(1), False, f"on {_day(d)}", {token, 'next'}
+    if words & PAST_WORDS or 'last' in words:
+        return None, today, True, "recently", PAST_WORDS | {'last'}
+    if words & UPCOMING_WORDS:
+        return today, None, False, "coming up", UPCOMING_WORDS
+    return None
+
+
+class ChatBot:
+    def __init__(self, events, clubs, event_words, club_words):
+        self.events = events
+        self.clubs = clubs
+        self.event_words = event_words
+        self.club_words = club_words
+
+    def answer(self, message, today=None):
+        today = today or datetime.date.today()
+        tokens = tokenize(message)
+        words = set(tokens)
+        window = date_window(message, tokens, today)
+        used = set(window[4]) if window else set()
+
+        kind = None
+        for token in tokens:
+            for candidate in (token, token[:-1] if token.endswith('s') else None):
+                if candidate and (candidate in TYPE_WORDS or self.event_words.has(facet('type', candidate))):
+                    kind, used = candidate, used | {token}
+                    break
+            if kind:
+                break
+
+        club = self.find_club(words)
+        if club:
+            used |= set(self.club_words.terms_of(club.doc_id))
+
+        if not (window or kind or club) and words & HELP_WORDS:
+            return self.help_reply(words)
+        rest = [t for t in tokens if t not in STOPWORDS and t not in used and t not in HELP_WORDS]
+        # words no event contains can only empty the result, so they're dropped if some others are known;
+        # if none are, the question is about something there are no events for
+        known = [t for t in rest if self.event_words.has(t)]
+        if not (window or kind or club or known):
+            if rest and words & {'when', 'where'}:
+                return f"I couldn't find any events matching \"{' '.join(rest)}\"."
+            if words & {'club', 'clubs'}:
+                return self.list_clubs()
+            return self.help_reply(words)
+        rest = known or rest
+
+        terms = ([facet('type', kind)] if kind else []) + ([facet('club_name', club['name'])] if club else []) + rest
+        what = f"{kind.capitalize()} events" if kind else "Events"
+        if club:
+            what += f" by {club['name']}"
+        if rest:
+            what += f" matching \"{' '.join(rest)}\""
+
+        if window:
+            start, stop, reverse, label, _ = window
+            found, more = self.find_events(start, stop, reverse, terms)
+        else:
+            label = "coming up"
+            found, more = self.find_events(today, None, False, terms)
+            if not found:
+                label = "in the past"
+                found, more = self.find_events(None, today, True, terms)
+        if not found:
+            reply = f"No {what[0].lower() + what[1:]} {label if window else 'found'}."
+            if club and not kind and not rest and club.get('description'):
+                reply += f" {club['name']}: {club['description']}"
+            return reply
+        lines = [f"{what} {label}:"] + [f"• {self.describe(e, today)}" for e in found]
+        if more:
+            lines.append("…and more on the Events page.")
+        return "\n".join(lines)
+
+    def find_events(self, start, stop, reverse, terms):
+        """Up to MAX_RESULTS events in the window filed under every term, and whether there are more."""
+        start = start.isoformat() if start else None
+        stop = stop.isoformat() if stop else None
+        keys = self.event_words.matching(terms) if terms else None
+        # sorting the matches costs about len(keys); walking the window until enough of them turn up
+        # costs about MAX_RESULTS / (share of events that match), capped by the window's size
+        walk = self.events.range_size(start, stop)
+        if keys:
+            walk = min(walk, (MAX_RESULTS + 1) * len(self.events) // len(keys))
+        if keys is not None and len(keys) <= walk:
+            found = []
+            for doc_id in keys:
+                doc = self.events.by_id(doc_id)
+                value = self.events.order_key(doc)[0] if doc is not None else None
+                if value is not None and (start is None or value >= start) and (stop is None or value < stop):
+                    found.append(doc)
+            found.sort(key=self.events.order_key, reverse=reverse)
+        else:
+            docs = self.events.ordered(start, stop, reverse=reverse)
+            if keys is not None:
+                docs = (doc for doc in docs if doc.doc_id in keys)
+            found = list(islice(docs, MAX_RESULTS + 1))
+        return found[:MAX_RESULTS], len(found) > MAX_RESULTS
+
+    def find_club(self, words):
+        # the club whose whole name appears in the question; the longest name wins
+        best = None
+        for doc_id in self.club_words.matching_any(words):
+            name_words = self.club_words.terms_of(doc_id)
+            if name_words and set(name_words) <= words and (best is None or len(name_words) > best[0]):
+                best = (len(name_words), doc_id)
+        return self.clubs.by_id(best[1]) if best else None
+
+    def describe(self, e, today):
+        d = _date(e.get('date'))
+        when = (_day(d) + (f" {d.year}" if d.year != today.year else "")) if d else e.get('date', 'date TBC')
+        text = f"{e.get('title', 'Untitled')} — {e.get('club_name', '')}, {when}"
+        if e.get('location'):
+            text += f", {e['location']}"
+        return text
+
+    def list_clubs(self):
+        names = [c['name'] for c in islice(iter(self.clubs), MAX_RESULTS + 1)]
+        if not names:
+            return "There are no clubs yet. Admins can start one from the Clubs page."
+        listed = ", ".join(names[:MAX_RESULTS]) + (", …" if len(names) > MAX_RESULTS else "")
+        return f"There are {len(self.clubs)} clubs, including {listed}. See the Clubs page to join one."
+
+    def help_reply(self, words):
+        if words & {'register', 'registration', 'join'}:
+            return "Log in, find an event, and click 'Register Now'."
+        if words & {'host', 'create', 'organise', 'organize'}:
+            return "Log in as Admin and click 'Host Event'."
+        if words & {'club', 'clubs'}:
+            return "Check the 'Clubs' page to join or start one."
+        return ("I can help with events, clubs, or registration. Try \"what's on this week?\", "
+                "\"workshops next month\" or \"when is Improv Night?\".")
@@ -0,0 +1,159 @@
+"""Write locking and change propagation between worker processes sharing one database.
+
+``ProcessLock`` is the app's write lock. It is reentrant within a process,
+and while any thread holds it the process also holds an exclusive ``flock``
+on ``<db>.lock``, so writers in different workers take turns. Each write
+block appends one line to the change journal ``<db>.changes`` naming the
+documents it touched (tables report them through ``changed()``, usually via
+a ``ChangeRecorder`` watcher).
+
+The journal doubles as the generation counter: ``sync()`` compares its
+inode and size with what this process last read, which costs a single
+``stat()``. Only when the journal has grown are the new lines read and
+handed to the ``apply`` callback as ``{table: {doc_id, ...} or None}`` (None
+meaning the whole table), so a worker re-reads just what other workers
+changed. Taking the lock syncs too, so every write starts from current
+data. A journal that was rotated away (past ``max_bytes``) means ``apply(None)``:
+reload everything. Until ``apply`` is set the journal stays unread, so whatever
+other processes write in the meantime is applied once it is.
+"""
+import fcntl
+import json
+import os
+import threading
+
+
+class ProcessLock:
+    def __init__(self, path, apply=None, max_bytes=4 * 1024 * 1024):
+        self.lock_path = path + '.lock'
+        self.journal_path = path + '.changes'
+        self.apply = apply
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._pid = None
+        self._fd = None
+        self._pending = {}
+        self._applying = False
+        self._seen = self._stat()
+
+    def _lock_fd(self):
+        # flock belongs to the open file, which a forked worker shares with its parent, so each process opens its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _stat(self):
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    # --- the lock ----------------------------------------------------------------
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                fcntl.flock(self._lock_fd(), fcntl.LOCK_EX)
+                self._catch_up()
+            except BaseException:
+                self._release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        if self._depth == 1 and self._pending:
+            # written even when the block raised: whatever reached storage before the error must reach the others too
+            self._publish()
+        self._release()
+
+    def _release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._lock_fd(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    # --- change journal ----------------------------------------------------------
+
+    def changed(self, table=None, doc_ids=None):
+        """Record a change made under the lock: some docs of ``table``, all of it, or (no table) storage only."""
+        if self._depth == 0 or self._applying:
+            return
+        if table is None:
+            self._pending.setdefault('', set())
+        elif doc_ids is None:
+            self._pending[table] = None
+        elif self._pending.get(table, ()) is not None:
+            self._pending.setdefault(table, set()).update(doc_ids)
+
+    def _publish(self):
+        line = json.dumps({t: sorted(ids) if ids is not None else None for t, ids in self._pending.items()},
+                          separators=(',', ':')) + '\n'
+        self._pending = {}
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        seen = self._stat()
+        if seen[1] > self.max_bytes:
+            # a fresh journal has a new inode, which every other process treats as "reload everything"
+            tmp = self.journal_path + '.tmp'
+            open(tmp, 'w').close()
+            os.replace(tmp, self.journal_path)
+            seen = self._stat()
+        if self.apply is not None:
+            self._seen = seen
+
+    def sync(self):
+        """Apply other processes' changes, if the journal says there are any."""
+        if self._stat() != self._seen:
+            with self:
+                pass
+
+    def _catch_up(self):
+        now = self._stat()
+        if now == self._seen or self.apply is None:
+            return
+        seen, self._seen = self._seen, now
+        if now is None:
+            return
+        if seen is None:
+            # another process started the journal; all of it is news
+            seen = (now[0], 0)
+        if seen[0] != now[0] or seen[1] > now[1]:
+            changes = None
+        else:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(seen[1])
+                data = f.read(now[1] - seen[1])
+            changes = {}
+            for line in data.splitlines():
+                for table, ids in json.loads(line).items():
+                    if ids is None or changes.get(table, ()) is None:
+                        changes[table] = None
+                    else:
+                        changes.setdefault(table, set()).update(ids)
+        self._applying = True
+        try:
+            self.apply(changes)
+        finally:
+            self._applying = False
+
+
+class ChangeRecorder:
+    """Watcher (see ``IndexedTable.watch``) that reports a table's writes to a ``ProcessLock``."""
+
+    def __init__(self, lock, table):
+        self.lock = lock
+        self.table = table
+
+    def add(self, doc_id, doc):
+        self.lock.changed(self.table, (doc_id,))
+
+    def drop(self, doc_id, doc=None):
+        self.lock.changed(self.table, (doc_id,))
+
+    def clear(self):
+        self.lock.changed(self.table)
@@ -0,0 +1,137 @@
+"""iCalendar (RFC 5545) feeds of events, and a cache of them kept current by table writes.
+
+``FeedCache`` holds rendered feeds by key, such as ``('user', username)`` or
+``('club', name)``. ``watcher(keys)`` gives a watcher for ``IndexedTable.watch()``
+that drops the feeds ``keys(doc)`` names whenever a document is added or
+dropped, so a feed is rebuilt only after a write that affects it, whether
+this worker made it or another one did. Feeds are byte-for-byte the same
+for the same data, so the ETag (a hash of the body) matches across rebuilds
+and workers, and polling clients keep getting 304s.
+"""
+import datetime
+import hashlib
+import threading
+
+PRODID = '-//ClubHub//Events//EN'
+
+
+def escape_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Split a content line into 75-octet pieces, never inside a UTF-8 sequence."""
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return [line]
+    parts, start, limit = [], 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        while end < len(raw) and raw[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(raw[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return [parts[0]] + [' ' + p for p in parts[1:]]
+
+
+def _day(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_lines(e, status='CONFIRMED'):
+    day = _day(e.get('date'))
+    if day is None:
+        return []
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{e['id']}@clubhub",
+        # documents carry no modification time; a stamp derived from the event keeps the feed deterministic
+        f'DTSTAMP:{day:%Y%m%d}T000000Z',
+        f'DTSTART;VALUE=DATE:{day:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{day + datetime.timedelta(1):%Y%m%d}',
+        f"SUMMARY:{escape_text(e.get('title', 'Event'))}",
+        f'STATUS:{status}',
+    ]
+    for field, name in (('location', 'LOCATION'), ('description', 'DESCRIPTION'), ('type', 'CATEGORIES')):
+        if e.get(field):
+            lines.append(f'{name}:{escape_text(e[field])}')
+    if e.get('club_name'):
+        lines.append(f"ORGANIZER;CN={escape_text(e['club_name'])}:noreply@clubhub.invalid")
+    lines.append('END:VEVENT')
+    return lines
+
+
+def render_feed(name, events):
+    """``events`` is a list of ``(event, status)``; returns the calendar as bytes."""
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+             f'X-WR-CALNAME:{escape_text(name)}']
+    for e, status in events:
+        lines += event_lines(e, status)
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(part for line in lines for part in fold(line)) + '\r\n').encode('utf-8')
+
+
+class _Invalidator:
+    def __init__(self, cache, keys):
+        self.cache = cache
+        self.keys = keys
+
+    def add(self, doc_id, doc):
+        self.cache.drop(*self.keys(doc))
+
+    def drop(self, doc_id, doc=None):
+        if doc is not None:
+            self.cache.drop(*self.keys(doc))
+
+    def clear(self):
+        self.cache.clear()
+
+
+class FeedCache:
+    def __init__(self):
+        # key -> (body, etag, last_modified); `previous` keeps the etag and date of dropped feeds, so a rebuild
+        # that comes out the same keeps its Last-Modified
+        self.fresh = {}
+        self.previous = {}
+        self._drops = {}
+        self._clears = 0
+        self._lock = threading.Lock()
+
+    def watcher(self, keys):
+        return _Invalidator(self, keys)
+
+    def drop(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.fresh.pop(key, None)
+                self._drops[key] = self._drops.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self.fresh.clear()
+            self._clears += 1
+
+    def get(self, key, build):
+        """Return ``(body, etag, last_modified)`` for ``key``, calling ``build()`` for the body if it isn't cached."""
+        hit = self.fresh.get(key)
+        if hit is not None:
+            return hit
+        seen = (self._clears, self._drops.get(key, 0))
+        body = build()
+        etag = hashlib.sha1(body).hexdigest()
+        before = self.previous.get(key)
+        if before is not None and before[0] == etag:
+            modified = before[1]
+        else:
+            modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        entry = (body, etag, modified)
+        with self._lock:
+            # a write that landed while building may have made this body stale already
+            if seen == (self._clears, self._drops.get(key, 0)):
+                self.fresh[key] = entry
+                self.previous[key] = (etag, modified)
+        return entry
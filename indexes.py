@@ -0,0 +1,207 @@
+"""In-process hash indexes over TinyDB-style tables.
+
+``IndexedTable`` wraps a table object (TinyDB ``Table``, ``LogTable`` or
+``SQLiteTable``) and keeps ``field -> value -> {doc_id: doc}`` maps for the
+fields it was given. Writes made through the wrapper keep the maps current;
+everything else is passed straight to the wrapped table. With ``order_by``
+it also keeps the documents in a list sorted by ``(doc[order_by], doc_id)``
+for range scans and keyset pagination. Watchers registered with ``watch()``
+(such as a ``textindex.TextIndex``) see every document added or dropped.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+from tinydb.table import Document
+
+
+class IndexedTable:
+    def __init__(self, table, fields, order_by=None, order_default=''):
+        self.table = table
+        self.fields = tuple(fields)
+        self.order_by = order_by
+        self.order_default = order_default
+        self._docs = {}
+        self._index = {f: {} for f in self.fields}
+        self._order = []
+        self._watchers = []
+        self.rebuild()
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        # a snapshot of the references, not the documents, so writes during iteration are safe
+        return iter(list(self._docs.values()))
+
+    def __repr__(self):
+        return '<IndexedTable %r on %s>' % (self.table, ', '.join(self.fields))
+
+    def rebuild(self):
+        self._docs.clear()
+        self._order.clear()
+        for watcher in self._watchers:
+            watcher.clear()
+        for buckets in self._index.values():
+            buckets.clear()
+        for doc in self.table.all():
+            self._add(doc.doc_id, doc, sort=False)
+        self._order.sort()
+
+    def watch(self, watcher, replay=True):
+        """Keep ``watcher`` told of every document added or dropped (see textindex.TextIndex).
+
+        With ``replay`` it is first told of every document already in the table.
+        """
+        self._watchers.append(watcher)
+        if replay:
+            for doc_id, doc in list(self._docs.items()):
+                watcher.add(doc_id, doc)
+
+    def refresh(self, doc_ids):
+        """Re-read ``doc_ids`` after another process changed them; returns the ``(old, new)`` documents."""
+        old = [self._docs[doc_id] for doc_id in doc_ids if doc_id in self._docs]
+        for doc_id in doc_ids:
+            self._drop(doc_id)
+        new = self.table.get(doc_ids=list(doc_ids))
+        for doc in new:
+            self._add(doc.doc_id, doc)
+        return old, new
+
+    def order_key(self, doc):
+        return (doc.get(self.order_by, self.order_default), doc.doc_id)
+
+    def _add(self, doc_id, doc, sort=True):
+        self._docs[doc_id] = doc
+        if self.order_by:
+            if sort:
+                insort(self._order, self.order_key(doc))
+            else:
+                self._order.append(self.order_key(doc))
+        for f in self.fields:
+            if f in doc:
+                self._index[f].setdefault(doc[f], {})[doc_id] = doc
+        for watcher in self._watchers:
+            watcher.add(doc_id, doc)
+
+    def _drop(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        if self.order_by:
+            i = bisect_left(self._order, self.order_key(doc))
+            if i < len(self._order) and self._order[i][1] == doc_id:
+                del self._order[i]
+        for f in self.fields:
+            bucket = self._index[f].get(doc.get(f))
+            if bucket is not None:
+                bucket.pop(doc_id, None)
+                if not bucket:
+                    del self._index[f][doc[f]]
+        for watcher in self._watchers:
+            watcher.drop(doc_id, doc)
+
+    # --- lookups ---------------------------------------------------------------
+
+    def find(self, **match):
+        """Documents whose fields equal ``match``; at least one field must be indexed.
+
+        The returned documents are the index's own copies and must not be mutated.
+        """
+        indexed = [f for f in match if f in self._index]
+        if not indexed:
+            raise KeyError('none of %s is indexed on %s' % (sorted(match), self.table.name))
+        buckets = [self._index[f].get(match[f], {}) for f in indexed]
+        # list() copies the bucket in one step, so a concurrent write can't break the iteration
+        smallest = list(min(buckets, key=len).values())
+        return [doc for doc in smallest if all(doc.get(f) == v for f, v in match.items())]
+
+    def find_one(self, **match):
+        found = self.find(**match)
+        return found[0] if found else None
+
+    def ordered(self, start=None, stop=None, after=None, reverse=False):
+        """Yield documents in order_by order with ``start <= value < stop``.
+
+        ``after`` is an ``order_key`` to resume strictly past, in the direction of travel.
+        """
+        keys = self._order
+        if not reverse:
+            i = bisect_left(keys, (start,)) if start is not None else 0
+            if after is not None:
+                i = max(i, bisect_right(keys, after))
+            while i < len(keys) and (stop is None or keys[i][0] < stop):
+                doc = self._docs.get(keys[i][1])
+                if doc is not None:
+                    yield doc
+                i += 1
+        else:
+            i = bisect_left(keys, (stop,)) if stop is not None else len(keys)
+            if after is not None:
+                i = min(i, bisect_left(keys, after))
+            while i > 0 and (start is None or keys[i - 1][0] >= start):
+                i -= 1
+                doc = self._docs.get(keys[i][1])
+                if doc is not None:
+                    yield doc
+
+    def by_id(self, doc_id):
+        return self._docs.get(doc_id)
+
+    def range_size(self, start=None, stop=None):
+        """How many documents ``ordered(start, stop)`` would yield, found by bisection."""
+        i = bisect_left(self._order, (start,)) if start is not None else 0
+        j = bisect_left(self._order, (stop,)) if stop is not None else len(self._order)
+        return max(0, j - i)
+
+    def count_of(self, field, value):
+        return len(self._index[field].get(value, ()))
+
+    def values(self, field):
+        return self._index[field].keys()
+
+    # --- writes ----------------------------------------------------------------
+
+    def insert(self, document):
+        doc_id = self.table.insert(document)
+        self._add(doc_id, Document(dict(document), doc_id))
+        return doc_id
+
+    def insert_multiple(self, documents):
+        documents = [dict(d) for d in documents]
+        doc_ids = self.table.insert_multiple(documents)
+        for doc_id, doc in zip(doc_ids, documents):
+            self._add(doc_id, Document(doc, doc_id))
+        return doc_ids
+
+    def update(self, fields, cond=None, doc_ids=None):
+        updated = self.table.update(fields, cond, doc_ids)
+        for doc_id in updated:
+            self._drop(doc_id)
+            doc = self.table.get(doc_id=doc_id)
+            if doc is not None:
+                self._add(doc_id, doc)
+        return updated
+
+    def update_bulk(self, fields, doc_ids):
+        """``update`` for many documents at once: one write, then one re-read instead of one per document."""
+        updated = self.table.update(fields, doc_ids=doc_ids)
+        if updated:
+            self.rebuild()
+        return updated
+
+    def remove(self, cond=None, doc_ids=None):
+        removed = self.table.remove(cond, doc_ids)
+        for doc_id in removed:
+            self._drop(doc_id)
+        return removed
+
+    def remove_where(self, **match):
+        """Remove the documents ``find(**match)`` returns, by doc id rather than a table scan."""
+        doc_ids = [doc.doc_id for doc in self.find(**match)]
+        return self.remove(doc_ids=doc_ids) if doc_ids else []
+
+    def truncate(self):
+        self.table.truncate()
+        self.rebuild()
@@ -0,0 +1,169 @@
+"""Server-Sent Events fan-out: one publisher, any number of idle listeners.
+
+``Broadcaster.publish(data)`` encodes a message once, as an SSE frame, into
+a ring of the last ``keep`` frames and wakes the listeners. A listener holds
+nothing but the sequence number of the last frame it sent: it wakes, writes
+the frames it hasn't sent yet (bytes shared by every listener) and waits
+again, so publishing costs the same for one listener as for thousands.
+A listener that fell further behind than the ring, or resumes from an id
+another process handed out, gets a fresh snapshot instead.
+
+Tables report what changed through ``watcher(key)`` (see
+``IndexedTable.watch``); ``flush()`` publishes the current values of the
+keys marked since the last flush. While anyone is listening, ``poll`` (the
+app passes ``db_lock.sync``) runs every ``poll_interval`` seconds, so
+writes made by other worker processes reach idle listeners too.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+
+def encode(event_id, data, event=None):
+    frame = f'id: {event_id}\n'
+    if event:
+        frame += f'event: {event}\n'
+    return (frame + f"data: {json.dumps(data, separators=(',', ':'))}\n\n").encode('utf-8')
+
+
+class _Marker:
+    def __init__(self, broadcaster, key):
+        self.broadcaster = broadcaster
+        self.key = key
+
+    def add(self, doc_id, doc):
+        self.broadcaster.mark(self.key(doc))
+
+    def drop(self, doc_id, doc=None):
+        if doc is not None:
+            self.broadcaster.mark(self.key(doc))
+
+    def clear(self):
+        self.broadcaster.mark_all()
+
+
+class Broadcaster:
+    def __init__(self, keep=256, heartbeat=15.0, poll=None, poll_interval=0.25, retry_ms=2000):
+        self.keep = keep
+        self.heartbeat = heartbeat
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.retry_ms = retry_ms
+        self.seq = 0
+        self.listeners = 0
+        # ids carry the process they came from, since every worker numbers its own frames
+        self._boot = uuid.uuid4().hex[:8]
+        self._frames = deque(maxlen=keep)
+        self._cond = threading.Condition()
+        self._marked = set()
+        self._all = False
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._poller = None
+        self._pid = None
+
+    def _origin(self):
+        return f'{self._boot}{os.getpid():x}'
+
+    def last_id(self):
+        return f'{self._origin()}.{self.seq}'
+
+    # --- publishing --------------------------------------------------------------
+
+    def publish(self, data, event=None):
+        with self._cond:
+            self.seq += 1
+            self._frames.append(encode(f'{self._origin()}.{self.seq}', data, event))
+            self._cond.notify_all()
+
+    def watcher(self, key):
+        """Watcher marking ``key(doc)`` for the next ``flush()`` whenever a document is added or dropped."""
+        return _Marker(self, key)
+
+    def mark(self, key):
+        with self._flush_lock:
+            self._marked.add(key)
+
+    def mark_all(self):
+        with self._flush_lock:
+            self._all = True
+
+    def flush(self, value, snapshot):
+        """Publish ``{key: value(key)}`` for the marked keys, or ``snapshot()`` as a reset if everything was."""
+        with self._flush_lock:
+            # values are read and published under one lock, so a later flush never goes out before an older one
+            if self._all:
+                self._all = False
+                self._marked.clear()
+                self.publish(snapshot(), 'reset')
+            elif self._marked:
+                keys, self._marked = self._marked, set()
+                self.publish({key: value(key) for key in keys})
+
+    # --- listening ---------------------------------------------------------------
+
+    def _since(self, seq):
+        """Frames after ``seq`` joined, b'' if there are none, None if some have left the ring."""
+        if seq >= self.seq:
+            return b''
+        first = self.seq - len(self._frames) + 1
+        if seq + 1 < first:
+            return None
+        return b''.join(islice(self._frames, seq + 1 - first, None))
+
+    def listen(self, last_id=None, snapshot=None):
+        """Iterator of SSE bytes: the frames after ``last_id`` (default: from now on), then every new one.
+
+        ``snapshot()`` stands in for frames that can't be replayed.
+        """
+        origin, _, seq = (last_id or '').partition('.')
+        with self._cond:
+            resume = seq.isdigit() and origin == self._origin() and int(seq) <= self.seq
+            start = int(seq) if resume else self.seq
+        return self._stream(start, snapshot if last_id and not resume else None, snapshot)
+
+    def _stream(self, seq, first, snapshot):
+        self._ensure_poller()
+        with self._cond:
+            self.listeners += 1
+        try:
+            yield f'retry: {self.retry_ms}\n\n'.encode()
+            if first is not None:
+                yield encode(self.last_id(), first(), 'reset')
+            while True:
+                with self._cond:
+                    if self.seq == seq:
+                        self._cond.wait(self.heartbeat)
+                    out, last = self._since(seq), self.seq
+                if out is None:
+                    out = encode(f'{self._origin()}.{last}', snapshot() if snapshot else {}, 'reset')
+                # a comment line when nothing happened keeps proxies from timing out and finds closed clients
+                yield out or b': ping\n\n'
+                seq = last
+        finally:
+            with self._cond:
+                self.listeners -= 1
+
+    def _ensure_poller(self):
+        # started lazily, and again in a forked worker, since threads don't survive fork()
+        if self.poll is None or (self._poller is not None and self._pid == os.getpid()):
+            return
+        with self._start_lock:
+            if self._poller is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._poller = threading.Thread(target=self._run_poller, name='live-poller', daemon=True)
+                self._poller.start()
+
+    def _run_poller(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if self.listeners:
+                try:
+                    self.poll()
+                except Exception:
+                    # the next tick tries again; a listener is better served late than not at all
+                    pass
@@ -0,0 +1,175 @@
+"""Counters and histograms in the Prometheus text format, plus per-request accounting.
+
+``registry`` is the process-wide set of metrics served at /metrics.
+``MeteredTable`` wraps a table and records every read, search and write it
+passes through; the storages call ``record_bytes`` for what they put on
+disk, the password pool calls ``record_time('hash', ...)`` and the batch
+writer ``record_time('writer', ...)``. Anything
+recorded during a request is also added to that request's ``RequestStats``,
+found through the getter given to ``use_request_stats``.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+READS = ('all', 'get', 'contains', 'count', '__len__')
+SEARCHES = ('search',)
+WRITES = ('insert', 'insert_multiple', 'update', 'update_multiple', 'upsert', 'remove', 'truncate')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for k, v in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def value(self, name, labels=()):
+        return self._counters.get((name, tuple(labels)), 0)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum)) for key, h in self._histograms.items())
+        lines, described = [], set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                kind, help_text = self._meta.get(name, (kind, ''))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), (buckets, counts, total) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ops = {}
+        self.seconds = {'db': 0.0, 'hash': 0.0, 'writer': 0.0, 'render': 0.0}
+        self.bytes_written = 0
+
+    def breakdown(self):
+        ops = ', '.join(f'{table}.{op}={n}' for (table, op), n in sorted(self.ops.items())) or 'none'
+        return (f"db {self.seconds['db'] * 1000:.1f} ms ({ops}), render {self.seconds['render'] * 1000:.1f} ms, "
+                f"hash {self.seconds['hash'] * 1000:.1f} ms, batch writer {self.seconds['writer'] * 1000:.1f} ms, "
+                f"wrote {self.bytes_written} bytes")
+
+
+registry = Metrics()
+registry.describe('clubhub_db_operations_total', 'counter', 'Table reads, searches and writes.')
+registry.describe('clubhub_db_operation_seconds_total', 'counter', 'Time spent in table operations.')
+registry.describe('clubhub_db_bytes_written_total', 'counter', 'Bytes written to the database files.')
+registry.describe('clubhub_password_hash_seconds_total', 'counter', 'Time spent waiting for password hashes.')
+
+_current = lambda: None  # noqa: E731
+
+
+def use_request_stats(getter):
+    global _current
+    _current = getter
+
+
+def record_op(table, op, seconds):
+    registry.inc('clubhub_db_operations_total', (('table', table), ('op', op)))
+    registry.inc('clubhub_db_operation_seconds_total', (('table', table), ('op', op)), seconds)
+    stats = _current()
+    if stats is not None:
+        stats.ops[(table, op)] = stats.ops.get((table, op), 0) + 1
+        stats.seconds['db'] += seconds
+
+
+def record_bytes(n):
+    registry.inc('clubhub_db_bytes_written_total', (), n)
+    stats = _current()
+    if stats is not None:
+        stats.bytes_written += n
+
+
+def record_time(part, seconds):
+    if part == 'hash':
+        registry.inc('clubhub_password_hash_seconds_total', (), seconds)
+    stats = _current()
+    if stats is not None:
+        stats.seconds[part] += seconds
+
+
+class MeteredTable:
+    """Pass-through wrapper around a table that records each read, search and write."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __repr__(self):
+        return '<MeteredTable %r>' % self.table
+
+    def __len__(self):
+        return self.__getattr__('__len__')()
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __getattr__(self, name):
+        attr = getattr(self.table, name)
+        op = 'read' if name in READS else 'search' if name in SEARCHES else 'write' if name in WRITES else None
+        if op is None:
+            return attr
+
+        def metered(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_op(self.table.name, op, time.perf_counter() - start)
+        return metered
@@ -0,0 +1,76 @@
+"""Versioned, run-once changes to the stored data.
+
+The database records the schema version it was last brought up to in a
+one-document ``meta`` table. ``migrate()`` runs once at startup, before any
+request is served, and applies every migration newer than that version.
+A migration names a table, a test for the documents that need it and a fix
+that changes such a document in place. The fixes of all pending migrations
+are applied with one bulk update per table, followed by the version stamp,
+so an up-to-date database costs one read of the tiny ``meta`` table. app.py
+runs it inside ``deferred_writes``, so on the json backend the backfills and
+the stamp reach db.json in a single rewrite.
+"""
+import uuid
+
+VERSION_FIELD = 'schema_version'
+
+
+def _missing_event_id(doc):
+    return not doc.get('id')
+
+
+def _add_event_id(doc):
+    # a fresh id per document; the old on-view backfill matched by title, so two same-titled events shared one
+    doc['id'] = str(uuid.uuid4())
+
+
+# (version, description, table, needs(doc), fix(doc)); fix() must leave needs() false
+MIGRATIONS = (
+    (1, 'give every event its own id', 'events', _missing_event_id, _add_event_id),
+)
+LATEST = MIGRATIONS[-1][0]
+
+
+def stored_version(meta):
+    docs = meta.all()
+    return docs[0].get(VERSION_FIELD, 0) if docs else 0
+
+
+def stamp_version(meta, version):
+    docs = meta.all()
+    if docs:
+        meta.update({VERSION_FIELD: version}, doc_ids=[docs[0].doc_id])
+    else:
+        meta.insert({VERSION_FIELD: version})
+
+
+def migrate(tables, meta, log=print):
+    """Apply the migrations newer than the stored version; returns ``{version: documents changed}``.
+
+    ``tables`` maps table names to ``IndexedTable``s, whose in-memory copies
+    are scanned to find the documents to change.
+    """
+    version = stored_version(meta)
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    if not pending:
+        return {}
+    changed = {}
+    for name in dict.fromkeys(m[2] for m in pending):
+        steps = [m for m in pending if m[2] == name]
+        doc_ids = set()
+        for number, _, _, needs, _ in steps:
+            found = [doc.doc_id for doc in tables[name] if needs(doc)]
+            changed[number] = len(found)
+            doc_ids.update(found)
+        if not doc_ids:
+            continue
+
+        def fix(doc, steps=steps):
+            for _, _, _, needs, fix_doc in steps:
+                if needs(doc):
+                    fix_doc(doc)
+        tables[name].update_bulk(fix, sorted(doc_ids))
+    stamp_version(meta, LATEST)
+    for number, description, name, _, _ in pending:
+        log(f"schema v{number}: {description} ({changed.get(number, 0)} {name} changed)")
+    return changed
@@ -0,0 +1,115 @@
+"""Password hashing off the request thread.
+
+scrypt is deliberately slow, so ``HashPool`` runs it in a process pool
+sized to the machine. A semaphore bounds how many hashes can be waiting;
+past that, callers get ``Busy`` immediately instead of piling up behind
+the pool. Successful verifications are remembered for a short while
+under an HMAC key, so a user logging in again doesn't pay for scrypt.
+"""
+import hashlib
+import hmac
+import itertools
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import record_time
+from writer import Busy
+
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+def hash_method(stored):
+    return stored.split('$', 1)[0]
+
+
+class HashPool:
+    def __init__(self, workers=None, max_pending=None, method=DEFAULT_METHOD, cache_ttl=300, cache_size=10000):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self.method = method
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._cache = OrderedDict()
+        self._cache_key = secrets.token_bytes(32)
+        self._stored_method = None
+
+    def _executor(self):
+        # created lazily, and again in a forked worker, since a pool can't be shared across fork()
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ProcessPoolExecutor(self.workers)
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise Busy()
+        start = time.perf_counter()
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            record_time('hash', time.perf_counter() - start)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        # for bulk imports: spread over every worker and skip the per-request queue limit
+        return list(self._executor().map(generate_password_hash, passwords, itertools.repeat(self.method), chunksize=16))
+
+    def verify(self, stored, password):
+        """Return ``(ok, new_hash)``; ``new_hash`` is set when ``stored`` used outdated parameters."""
+        key = hmac.new(self._cache_key, f"{stored}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+        if not self._cached(key):
+            if not self._run(check_password_hash, stored, password):
+                return False, None
+            self._remember(key)
+        try:
+            if hash_method(stored) != self.stored_method():
+                return True, self.hash(password)
+        except Busy:
+            # the password was right; the upgrade waits for a login when the pool has room
+            pass
+        return True, None
+
+    def stored_method(self):
+        """``method`` as werkzeug writes it into a hash: ``scrypt`` is stored as ``scrypt:32768:8:1``."""
+        # found by hashing once, on first use rather than at import, so startup doesn't pay for it
+        if self._stored_method is None:
+            self._stored_method = hash_method(self._run(generate_password_hash, '', self.method))
+        return self._stored_method
+
+    def _cached(self, key):
+        with self._lock:
+            expires = self._cache.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._cache[key]
+                return False
+            self._cache.move_to_end(key)
+            return True
+
+    def _remember(self, key):
+        with self._lock:
+            self._cache[key] = time.monotonic() + self.cache_ttl
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
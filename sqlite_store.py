@@ -0,0 +1,232 @@
+"""SQLite backend exposing the part of TinyDB's Table API that app.py uses.
+
+Each TinyDB table becomes a ``(doc_id, doc)`` SQLite table holding the
+document as JSON. Simple ``Query()`` conditions (``==``, comparisons,
+``one_of``, ``&`` and ``|``) are translated to SQL over ``json_extract``
+expressions, which the expression indexes in ``INDEXES`` serve; anything
+else falls back to evaluating the query in Python row by row.
+"""
+import json
+import re
+import sqlite3
+import threading
+import uuid
+
+from tinydb.table import Document
+
+from metrics import record_bytes
+
+
+INDEXES = {
+    'users': [('username',)],
+    'clubs': [('name',)],
+    'events': [('id',), ('date',), ('club_name',)],
+    'registrations': [('event_id', 'username'), ('username',)],
+}
+
+_OPS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_FIELD = re.compile(r'^\w+$')
+
+
+def _column(path):
+    if not path or not all(isinstance(p, str) and _FIELD.match(p) for p in path):
+        return None
+    return "json_extract(doc, '$.%s')" % '.'.join(path)
+
+
+def _to_sql(h):
+    """Translate a TinyDB query hash into (sql, params), or None if it has no SQL form."""
+    if not isinstance(h, tuple) or not h:
+        return None
+    op = h[0]
+    if op in ('and', 'or'):
+        parts = [_to_sql(sub) for sub in h[1]]
+        if not parts or None in parts:
+            return None
+        return '(' + (' %s ' % op.upper()).join(p[0] for p in parts) + ')', [v for p in parts for v in p[1]]
+    if op in _OPS and len(h) == 3:
+        col = _column(h[1])
+        if col is None or not isinstance(h[2], (str, int, float)) or isinstance(h[2], bool):
+            return None
+        return '%s %s ?' % (col, _OPS[op]), [h[2]]
+    if op == 'one_of' and len(h) == 3:
+        col = _column(h[1])
+        values = h[2]
+        if col is None or not isinstance(values, tuple) or not all(isinstance(v, (str, int, float)) for v in values):
+            return None
+        if not values:
+            return '0', []
+        return '%s IN (%s)' % (col, ','.join('?' * len(values))), list(values)
+    return None
+
+
+def _where(cond):
+    h = getattr(cond, '_hash', None) if cond is not None else None
+    return _to_sql(h) if h is not None else None
+
+
+class SQLiteTable:
+    def __init__(self, db, name):
+        self._db = db
+        self.name = name
+        self._q = '"%s"' % name.replace('"', '""')
+        with db.lock, db.conn:
+            db.conn.execute('CREATE TABLE IF NOT EXISTS %s (doc_id INTEGER PRIMARY KEY, doc TEXT NOT NULL)' % self._q)
+            for fields in INDEXES.get(name, []):
+                idx = '"ix_%s_%s"' % (name, '_'.join(fields))
+                cols = ', '.join(_column((f,)) for f in fields)
+                db.conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (idx, self._q, cols))
+
+    def __repr__(self):
+        return '<SQLiteTable name=%r>' % self.name
+
+    def _rows(self, cond=None, doc_ids=None):
+        """Yield (doc_id, doc) pairs matching cond / doc_ids, in doc_id order."""
+        sql = 'SELECT doc_id, doc FROM %s' % self._q
+        params = []
+        where = _where(cond)
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            sql += ' WHERE doc_id IN (%s)' % ','.join('?' * len(doc_ids)) if doc_ids else ' WHERE 0'
+            params = doc_ids
+        elif where is not None:
+            sql += ' WHERE ' + where[0]
+            params = where[1]
+        with self._db.lock:
+            rows = self._db.conn.execute(sql + ' ORDER BY doc_id', params).fetchall()
+        for doc_id, raw in rows:
+            doc = json.loads(raw)
+            if cond is None or where is not None or doc_ids is not None or cond(doc):
+                yield doc_id, doc
+
+    def all(self):
+        return [Document(doc, doc_id) for doc_id, doc in self._rows()]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        with self._db.lock:
+            return self._db.conn.execute('SELECT COUNT(*) FROM %s' % self._q).fetchone()[0]
+
+    def search(self, cond):
+        return [Document(doc, doc_id) for doc_id, doc in self._rows(cond)]
+
+    def get(self, cond=None, doc_id=None, doc_ids=None):
+        if doc_id is not None:
+            found = list(self._rows(doc_ids=[doc_id]))
+            return Document(found[0][1], found[0][0]) if found else None
+        if doc_ids is not None:
+            return [Document(doc, i) for i, doc in self._rows(doc_ids=doc_ids)]
+        if cond is not None:
+            for i, doc in self._rows(cond):
+                return Document(doc, i)
+            return None
+        raise RuntimeError('You have to pass either cond or doc_id or doc_ids')
+
+    def contains(self, cond=None, doc_id=None):
+        if doc_id is not None:
+            return self.get(doc_id=doc_id) is not None
+        return self.get(cond) is not None
+
+    def count(self, cond):
+        where = _where(cond)
+        if where is None:
+            return len(self.search(cond))
+        with self._db.lock:
+            return self._db.conn.execute('SELECT COUNT(*) FROM %s WHERE %s' % (self._q, where[0]), where[1]).fetchone()[0]
+
+    def insert(self, document):
+        return self.insert_multiple([document])[0]
+
+    def insert_multiple(self, documents):
+        doc_ids, written = [], 0
+        with self._db.lock, self._db.conn:
+            for document in documents:
+                raw = json.dumps(dict(document))
+                cur = self._db.conn.execute('INSERT INTO %s (doc_id, doc) VALUES (?, ?)' % self._q,
+                                            (getattr(document, 'doc_id', None), raw))
+                doc_ids.append(cur.lastrowid)
+                written += len(raw)
+        # document bytes handed to SQLite; page and WAL overhead aren't counted
+        record_bytes(written)
+        return doc_ids
+
+    def update(self, fields, cond=None, doc_ids=None):
+        with self._db.lock, self._db.conn:
+            changed, written = list(self._rows(cond, doc_ids)), 0
+            for doc_id, doc in changed:
+                if callable(fields):
+                    fields(doc)
+                else:
+                    doc.update(fields)
+                raw = json.dumps(doc)
+                self._db.conn.execute('UPDATE %s SET doc = ? WHERE doc_id = ?' % self._q, (raw, doc_id))
+                written += len(raw)
+        record_bytes(written)
+        return [doc_id for doc_id, _ in changed]
+
+    def remove(self, cond=None, doc_ids=None):
+        if cond is None and doc_ids is None:
+            raise RuntimeError('Use truncate() to remove all documents')
+        with self._db.lock, self._db.conn:
+            removed = [doc_id for doc_id, _ in self._rows(cond, doc_ids)]
+            self._db.conn.executemany('DELETE FROM %s WHERE doc_id = ?' % self._q, [(i,) for i in removed])
+        return removed
+
+    def truncate(self):
+        with self._db.lock, self._db.conn:
+            self._db.conn.execute('DELETE FROM %s' % self._q)
+
+    def clear_cache(self):
+        pass
+
+
+class SQLiteDB:
+    """Drop-in for the ``TinyDB`` object in app.py: ``table()``, ``tables()``, ``drop_tables()``, ``close()``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.RLock()
+        self._tables = {}
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = SQLiteTable(self, name)
+        return self._tables[name]
+
+    def tables(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+        return {r[0] for r in rows}
+
+    def drop_tables(self):
+        # tables are emptied rather than dropped so the Table objects app.py holds stay usable
+        for name in self.tables():
+            self.table(name).truncate()
+
+    def close(self):
+        self.conn.close()
+
+
+def migrate_json(source_path, db):
+    """Copy a TinyDB db.json into ``db``, keeping doc ids and giving legacy events an ``id``.
+
+    Returns ``{table: rows_copied}``. Runs as a single transaction.
+    """
+    with open(source_path, encoding='utf-8') as f:
+        data = json.load(f)
+    counts = {}
+    tables = {name: db.table(name) for name in data}
+    with db.lock, db.conn:
+        for name, docs in data.items():
+            table = tables[name]
+            for doc_id, doc in docs.items():
+                if name == 'events' and 'id' not in doc:
+                    doc['id'] = str(uuid.uuid4())
+                db.conn.execute('INSERT INTO %s (doc_id, doc) VALUES (?, ?)' % table._q, (int(doc_id), json.dumps(doc)))
+            counts[name] = len(docs)
+    return counts
@@ -0,0 +1,208 @@
+"""Registration analytics kept current by the tables' own writes.
+
+``Stats`` watches the events and registrations tables (see
+``IndexedTable.watch``) and keeps counters per event, club and student, plus
+sign-ups per day, overall and per club, from the ``registered_on`` date of
+each registration (older rows have none and are only counted, not dated).
+A registration moves a handful of counters and an event created or deleted
+moves its club's totals by the event's own, so nothing is ever recounted.
+``Ranking`` keeps counts grouped by value, so the top entries are read off
+without sorting, and the dashboard costs the same however many
+registrations there have been. Watching with ``replay`` builds everything
+from the tables at startup.
+"""
+import datetime
+import threading
+from bisect import bisect_left, insort
+
+
+class Ranking:
+    """Counts by key, grouped by value so that ``top(n)`` reads n entries instead of sorting them all."""
+
+    def __init__(self):
+        self.counts = {}
+        self._buckets = {}  # count -> {key: None}, oldest first
+        self._levels = []   # the counts that have a bucket, ascending
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get(self, key):
+        return self.counts.get(key, 0)
+
+    def set(self, key, value):
+        old = self.counts.pop(key, 0)
+        if old:
+            bucket = self._buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[old]
+                del self._levels[bisect_left(self._levels, old)]
+        if value > 0:
+            self.counts[key] = value
+            bucket = self._buckets.get(value)
+            if bucket is None:
+                bucket = self._buckets[value] = {}
+                insort(self._levels, value)
+            bucket[key] = None
+
+    def add(self, key, delta):
+        self.set(key, self.counts.get(key, 0) + delta)
+
+    def top(self, n):
+        """The ``n`` highest ``(key, count)`` pairs; ties in the order they reached that count."""
+        out = []
+        for level in reversed(self._levels):
+            for key in self._buckets[level]:
+                if len(out) == n:
+                    return out
+                out.append((key, level))
+        return out
+
+    def clear(self):
+        self.counts.clear()
+        self._buckets.clear()
+        self._levels.clear()
+
+
+def _bump(days, day, delta):
+    n = days.get(day, 0) + delta
+    if n:
+        days[day] = n
+    else:
+        days.pop(day, None)
+
+
+def _last_days(n):
+    today = datetime.date.today()
+    return [(today - datetime.timedelta(i)).isoformat() for i in range(n - 1, -1, -1)]
+
+
+class _Watcher:
+    def __init__(self, lock, update, reset):
+        self.lock = lock
+        self.update = update
+        self.reset = reset
+
+    def add(self, doc_id, doc):
+        with self.lock:
+            self.update(doc, 1)
+
+    def drop(self, doc_id, doc=None):
+        if doc is not None:
+            with self.lock:
+                self.update(doc, -1)
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event_regs = {}          # event id -> registrations, whether or not the event still exists
+        self.event_days = {}          # event id -> {day: sign-ups}
+        self.event_club = {}          # event id -> club, for live events
+        self.club_events = {}         # club -> live events
+        self.top_events = Ranking()   # live events by registrations
+        self.top_clubs = Ranking()    # clubs by registrations for their live events
+        self.top_students = Ranking()  # username -> registrations
+        self.club_days = {}           # club -> {day: sign-ups}
+        self.days = {}                # day -> sign-ups
+        self.undated = 0
+
+    def events_watcher(self):
+        return _Watcher(self.lock, self._event, self._clear_events)
+
+    def registrations_watcher(self):
+        return _Watcher(self.lock, self._registration, self._clear_registrations)
+
+    # --- updates (under self.lock) -------------------------------------------------
+
+    def _event(self, doc, sign):
+        eid, club = doc.get('id'), doc.get('club_name')
+        if sign > 0:
+            self.event_club[eid] = club
+            self.top_events.set(eid, self.event_regs.get(eid, 0))
+        else:
+            self.event_club.pop(eid, None)
+            self.top_events.set(eid, 0)
+        _bump(self.club_events, club, sign)
+        self.top_clubs.add(club, sign * self.event_regs.get(eid, 0))
+        days = self.club_days.setdefault(club, {})
+        for day, n in self.event_days.get(eid, {}).items():
+            _bump(days, day, sign * n)
+        if not days:
+            del self.club_days[club]
+
+    def _registration(self, doc, sign):
+        eid, day = doc.get('event_id'), doc.get('registered_on')
+        _bump(self.event_regs, eid, sign)
+        self.top_students.add(doc.get('username'), sign)
+        if day:
+            _bump(self.days, day, sign)
+            days = self.event_days.setdefault(eid, {})
+            _bump(days, day, sign)
+            if not days:
+                del self.event_days[eid]
+        else:
+            self.undated += sign
+        if eid in self.event_club:
+            club = self.event_club[eid]
+            self.top_events.set(eid, self.event_regs.get(eid, 0))
+            self.top_clubs.add(club, sign)
+            if day:
+                days = self.club_days.setdefault(club, {})
+                _bump(days, day, sign)
+                if not days:
+                    del self.club_days[club]
+
+    def _clear_events(self):
+        # club totals are sums over live events, so they go with them; re-adding the events restores them
+        self.event_club.clear()
+        self.club_events.clear()
+        self.top_events.clear()
+        self.top_clubs.clear()
+        self.club_days.clear()
+
+    def _clear_registrations(self):
+        self.event_regs.clear()
+        self.event_days.clear()
+        self.top_events.clear()
+        self.top_clubs.clear()
+        self.top_students.clear()
+        self.club_days.clear()
+        self.days.clear()
+        self.undated = 0
+
+    # --- reads ---------------------------------------------------------------------
+
+    def summary(self, top=10, last_days=30):
+        """Top events, clubs and students and the last ``last_days`` days of sign-ups."""
+        with self.lock:
+            return {
+                'active_students': len(self.top_students),
+                'undated_registrations': self.undated,
+                'top_events': self.top_events.top(top),
+                'top_clubs': [(club, self.club_events.get(club, 0), n) for club, n in self.top_clubs.top(top)],
+                'top_students': self.top_students.top(top),
+                'signups': [(day, self.days.get(day, 0)) for day in _last_days(last_days)],
+            }
+
+    def club(self, name, last_days=30):
+        with self.lock:
+            days = self.club_days.get(name, {})
+            return {
+                'events': self.club_events.get(name, 0),
+                'registrations': self.top_clubs.get(name),
+                'signups': [(day, days.get(day, 0)) for day in _last_days(last_days)],
+            }
+
+    def event(self, eid, last_days=30):
+        with self.lock:
+            days = self.event_days.get(eid, {})
+            return {
+                'registrations': self.event_regs.get(eid, 0),
+                'signups': [(day, days.get(day, 0)) for day in _last_days(last_days)],
+            }
@@ -0,0 +1,343 @@
+"""Append-only log storage engine for TinyDB.
+
+The snapshot file keeps TinyDB's normal JSON layout, so it can still be opened
+with the default storage. Every mutation after the snapshot is appended to
+``<path>.log`` as one checksummed line, and the log is folded back into the
+snapshot by a background compaction once it grows past ``compact_bytes``.
+"""
+import contextlib
+import json
+import os
+import threading
+import zlib
+
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage, Storage
+from tinydb.table import Table
+
+from metrics import record_bytes
+
+
+class MeteredJSONStorage(JSONStorage):
+    """TinyDB's default storage, reporting the size of every rewrite to the metrics.
+
+    Inside ``deferred()`` writes are kept in memory, and the file is rewritten
+    once when the block ends however many writes it made.
+    """
+    _deferring = False
+    _pending = None
+
+    def read(self):
+        if self._pending is not None:
+            return self._pending
+        return super().read()
+
+    def write(self, data):
+        if self._deferring:
+            self._pending = data
+            return
+        super().write(data)
+        record_bytes(self._handle.tell())
+
+    @contextlib.contextmanager
+    def deferred(self):
+        self._deferring = True
+        try:
+            yield
+        finally:
+            # written even when the block raised, as each write would have been without deferring
+            self._deferring = False
+            data, self._pending = self._pending, None
+            if data is not None:
+                self.write(data)
+
+
+class LogStorage(Storage):
+    def __init__(self, path, compact_bytes=8 * 1024 * 1024, fsync=True):
+        super().__init__()
+        self.path = path
+        self.log_path = path + '.log'
+        self.old_log_path = path + '.log.1'
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        # held around compaction; app.py sets it to the cross-process write lock
+        self.process_lock = contextlib.nullcontext()
+        self._compactor = None
+        self._tables = {}
+        self._replay()
+        self._log = open(self.log_path, 'ab')
+        # how far into the log the in-memory tables reflect, for catching up with other processes' appends
+        self._read_upto = self._log.tell()
+        if os.path.exists(self.old_log_path):
+            # a compaction was interrupted; the replayed state already includes both logs
+            self.compact()
+
+    # --- startup -----------------------------------------------------------
+
+    def _replay(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self._tables = json.load(f)
+        for log_path in (self.old_log_path, self.log_path):
+            if os.path.exists(log_path):
+                self._replay_log(log_path)
+
+    def _replay_log(self, log_path):
+        good = 0
+        with open(log_path, 'rb') as f:
+            for line in f:
+                ops = _decode(line)
+                if ops is None:
+                    break
+                self._apply_ops(ops)
+                good += len(line)
+        if good != os.path.getsize(log_path):
+            # torn tail from a crash mid-append: drop it so new records follow a clean line
+            with open(log_path, 'r+b') as f:
+                f.truncate(good)
+
+    def _apply_ops(self, ops):
+        for op in ops:
+            if op[0] == 'put':
+                self._tables.setdefault(op[1], {})[op[2]] = op[3]
+            elif op[0] == 'del':
+                self._tables.get(op[1], {}).pop(op[2], None)
+            elif op[0] == 'drop':
+                self._tables.pop(op[1], None)
+
+    # --- Storage interface ---------------------------------------------------
+
+    def read(self):
+        with self._lock:
+            if not self._tables:
+                return None
+            return {name: {k: dict(doc) for k, doc in docs.items()} for name, docs in self._tables.items()}
+
+    def write(self, data):
+        # full-state writes (drop_tables, drop_table, stock Table instances) are diffed into log records
+        with self._lock:
+            ops = [['drop', name] for name in self._tables if name not in data]
+            for name, docs in data.items():
+                old = self._tables.get(name, {})
+                docs = {str(k): v for k, v in docs.items()}
+                ops += [['del', name, k] for k in old if k not in docs]
+                ops += [['put', name, k, v] for k, v in docs.items() if old.get(k) != v]
+            self._commit(ops)
+
+    def close(self):
+        with self._lock:
+            if self._log.closed:
+                return
+            compactor = self._compactor
+        if compactor:
+            compactor.join()
+        with self._lock:
+            if self._log.tell():
+                self.compact()
+            self._log.close()
+
+    def refresh(self):
+        """Apply what other processes appended to the log, or re-read everything if one compacted it."""
+        with self._lock:
+            try:
+                same = os.stat(self.log_path).st_ino == os.fstat(self._log.fileno()).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                with open(self.log_path, 'rb') as f:
+                    f.seek(self._read_upto)
+                    for line in f:
+                        ops = _decode(line)
+                        if ops is None:
+                            break
+                        self._apply_ops(ops)
+                        self._read_upto += len(line)
+            else:
+                self._log.close()
+                self._tables = {}
+                self._replay()
+                self._log = open(self.log_path, 'ab')
+                self._read_upto = self._log.tell()
+
+    # --- fast path used by LogTable --------------------------------------------
+
+    def table_data(self, name):
+        return self._tables.get(name, {})
+
+    def apply(self, name, updater):
+        with self._lock:
+            docs = self._tables.setdefault(name, {})
+            view = _TableView(docs)
+            try:
+                updater(view)
+            finally:
+                self._commit(view.ops(name))
+
+    def _commit(self, ops):
+        if not ops:
+            return
+        self._apply_ops(ops)
+        line = _encode(ops)
+        self._log.write(line)
+        record_bytes(len(line))
+        self._log.flush()
+        self._read_upto = self._log.tell()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        if self._log.tell() >= self.compact_bytes and self._compactor is None:
+            self._compactor = threading.Thread(target=self.compact, daemon=True)
+            self._compactor.start()
+
+    # --- compaction --------------------------------------------------------------
+
+    def compact(self):
+        # other processes must not append while the log is swapped out, and must reopen it afterwards
+        with self.process_lock:
+            self._compact()
+            if hasattr(self.process_lock, 'changed'):
+                self.process_lock.changed()
+
+    def _compact(self):
+        with self._lock:
+            # documents are replaced rather than mutated in place, so shallow copies are a stable snapshot
+            frozen = {name: dict(docs) for name, docs in self._tables.items()}
+            self._log.close()
+            if os.path.exists(self.old_log_path):
+                with open(self.old_log_path, 'ab') as old, open(self.log_path, 'rb') as new:
+                    old.write(new.read())
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.old_log_path)
+            self._log = open(self.log_path, 'ab')
+            self._read_upto = 0
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(frozen, f)
+                record_bytes(f.tell())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            os.remove(self.old_log_path)
+        finally:
+            with self._lock:
+                if self._compactor is threading.current_thread():
+                    self._compactor = None
+
+
+class _TableView:
+    """Int-keyed view of a live table handed to TinyDB updaters.
+
+    Reads hand out copies, so every change comes back through this view and
+    can be turned into put/del records without scanning the table.
+    """
+
+    def __init__(self, docs):
+        self._docs = docs
+        self._read = {}
+        self._dirty = set()
+
+    def __contains__(self, doc_id):
+        return str(doc_id) in self._docs
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        return (int(k) for k in self._docs)
+
+    def keys(self):
+        return list(self)
+
+    def __getitem__(self, doc_id):
+        key = str(doc_id)
+        if key not in self._read:
+            self._read[key] = dict(self._docs[key])
+        return self._read[key]
+
+    def __setitem__(self, doc_id, doc):
+        key = str(doc_id)
+        self._read.pop(key, None)
+        self._docs[key] = doc
+        self._dirty.add(key)
+
+    def __delitem__(self, doc_id):
+        key = str(doc_id)
+        self._read.pop(key, None)
+        del self._docs[key]
+        self._dirty.add(key)
+
+    def pop(self, doc_id, *default):
+        key = str(doc_id)
+        if key not in self._docs and default:
+            return default[0]
+        doc = self[doc_id]
+        del self[doc_id]
+        return doc
+
+    def clear(self):
+        self._dirty.update(self._docs)
+        self._read.clear()
+        self._docs.clear()
+
+    def ops(self, name):
+        for key, doc in self._read.items():
+            if key in self._docs and doc != self._docs[key]:
+                self._docs[key] = doc
+                self._dirty.add(key)
+        return [['put', name, k, self._docs[k]] if k in self._docs else ['del', name, k]
+                for k in sorted(self._dirty)]
+
+
+class LogTable(Table):
+    def _read_table(self):
+        return self._storage.table_data(self.name)
+
+    def _update_table(self, updater):
+        self._storage.apply(self.name, updater)
+        self.clear_cache()
+
+
+def forget_next_ids(db):
+    """TinyDB tables remember the next free doc id; once another process has inserted, it may be taken."""
+    for table in db._tables.values():
+        table._next_id = None
+
+
+class LogDB(TinyDB):
+    """TinyDB wired to LogStorage; use ``LogDB(path)`` wherever ``TinyDB(path)`` was used."""
+
+    table_class = LogTable
+    default_storage_class = LogStorage
+
+
+def _encode(ops):
+    payload = json.dumps(ops, separators=(',', ':')).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def _decode(line):
+    if not line.endswith(b'\n') or len(line) < 10:
+        return None
+    crc, payload = line[:8], line[9:-1]
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,231 @@
+"""Inverted token index over the text of table documents.
+
+A ``TextIndex`` is attached to an ``IndexedTable`` with ``watch()``, which
+feeds it every document added or dropped, so it stays current with the
+table without any write route having to know about it. Text fields are
+lower-cased and split into words; facet fields (an event's type, its club)
+are indexed whole as ``field=value`` terms so that filtering on them never
+matches a word that merely appears in a description. ``search()`` ranks
+documents with BM25, and with ``prefixes=True`` the index also keeps a
+``PrefixTrie`` of its words for type-ahead.
+"""
+import heapq
+import math
+import re
+from itertools import islice
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def facet(field, value):
+    return f'{field}={str(value).lower()}'
+
+
+# BM25 parameters: term-frequency saturation and document-length normalisation
+K1 = 1.2
+B = 0.75
+
+
+class _Node:
+    __slots__ = ('children', 'is_term', 'best')
+
+    def __init__(self):
+        self.children = {}
+        self.is_term = False
+        self.best = None
+
+
+class PrefixTrie:
+    """Words by prefix. Each node caches its ``BEST`` heaviest completions until a word under it changes."""
+
+    BEST = 10
+
+    def __init__(self, weight):
+        self.weight = weight
+        self.root = _Node()
+
+    def insert(self, word):
+        node = self.root
+        node.best = None
+        for ch in word:
+            node = node.children.setdefault(ch, _Node())
+            node.best = None
+        node.is_term = True
+
+    def remove(self, word):
+        path = [self.root]
+        for ch in word:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].is_term = False
+        for node in path:
+            node.best = None
+        for i in range(len(word), 0, -1):
+            if path[i].children or path[i].is_term:
+                break
+            del path[i - 1].children[word[i - 1]]
+
+    def complete(self, prefix, limit=BEST):
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        best = node.best
+        if best is None:
+            words, stack = [], [(node, prefix)]
+            while stack:
+                node_, word = stack.pop()
+                if node_.is_term:
+                    words.append(word)
+                # list() copies the children in one step, so a concurrent insert can't break the walk
+                stack.extend((child, word + ch) for ch, child in list(node_.children.items()))
+            best = node.best = heapq.nlargest(self.BEST, words, key=self.weight)
+        return best[:limit]
+
+
+class TextIndex:
+    def __init__(self, fields, facets=(), weights=None, prefixes=False):
+        self.fields = tuple(fields)
+        self.facets = tuple(facets)
+        # a word in a field with weight 3 counts as three occurrences when ranking
+        self.weights = weights or {}
+        # term -> {doc_id: occurrences}
+        self.postings = {}
+        # doc_id -> number of words indexed, and the terms it was filed under
+        self.lengths = {}
+        self.total_length = 0
+        self._terms = {}
+        self.trie = PrefixTrie(lambda term: len(self.postings.get(term, ()))) if prefixes else None
+
+    def __len__(self):
+        return len(self.lengths)
+
+    # --- watcher interface used by IndexedTable --------------------------------
+
+    def add(self, doc_id, doc):
+        counts, length = {}, 0
+        for field in self.fields:
+            weight = self.weights.get(field, 1)
+            for token in tokenize(str(doc.get(field) or '')):
+                counts[token] = counts.get(token, 0) + weight
+                length += weight
+        for field in self.facets:
+            if doc.get(field) is not None:
+                counts[facet(field, doc[field])] = 1
+        self._terms[doc_id] = list(counts)
+        self.lengths[doc_id] = length
+        self.total_length += length
+        for term, n in counts.items():
+            bucket = self.postings.get(term)
+            if bucket is None:
+                bucket = self.postings[term] = {}
+                if self.trie is not None and '=' not in term:
+                    self.trie.insert(term)
+            bucket[doc_id] = n
+
+    def drop(self, doc_id, doc=None):
+        for term in self._terms.pop(doc_id, ()):
+            bucket = self.postings.get(term)
+            if bucket is not None:
+                bucket.pop(doc_id, None)
+                if not bucket:
+                    del self.postings[term]
+                    if self.trie is not None and '=' not in term:
+                        self.trie.remove(term)
+        self.total_length -= self.lengths.pop(doc_id, 0)
+
+    def clear(self):
+        self.postings.clear()
+        self.lengths.clear()
+        self.total_length = 0
+        self._terms.clear()
+        if self.trie is not None:
+            self.trie = PrefixTrie(self.trie.weight)
+
+    # --- lookups -----------------------------------------------------------------
+
+    def has(self, term):
+        return term in self.postings
+
+    def terms_of(self, doc_id):
+        return self._terms.get(doc_id, ())
+
+    def matching(self, terms):
+        """Doc ids filed under every one of ``terms``."""
+        buckets = sorted((self.postings.get(t, {}) for t in terms), key=len)
+        if not buckets or not buckets[0]:
+            return set()
+        found = set(buckets[0])
+        for bucket in buckets[1:]:
+            found = {doc_id for doc_id in found if doc_id in bucket}
+            if not found:
+                break
+        return found
+
+    def matching_any(self, terms):
+        found = set()
+        for t in terms:
+            found.update(self.postings.get(t, ()))
+        return found
+
+    # --- ranking -------------------------------------------------------------------
+
+    def _scorer(self, term):
+        """Return ``(bucket, score(doc_id))`` for one term's BM25 contribution."""
+        bucket = self.postings.get(term)
+        if not bucket:
+            return {}, lambda doc_id: 0.0
+        n = len(self.lengths) or 1
+        avg = self.total_length / n or 1
+        idf = math.log(1 + (n - len(bucket) + 0.5) / (len(bucket) + 0.5))
+
+        def score(doc_id):
+            tf = bucket.get(doc_id)
+            if not tf:
+                return 0.0
+            return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * self.lengths.get(doc_id, 0) / avg))
+        return bucket, score
+
+    def search(self, terms, limit=20):
+        """The ``limit`` best ``(score, doc_id)`` pairs for any of ``terms``, best first."""
+        scores = {}
+        for term in set(terms):
+            bucket, score = self._scorer(term)
+            for doc_id in list(bucket):
+                scores[doc_id] = scores.get(doc_id, 0.0) + score(doc_id)
+        return heapq.nlargest(limit, ((s, doc_id) for doc_id, s in scores.items()))
+
+    def suggest(self, terms, prefix, limit=8, expansions=5, budget=2000):
+        """Best doc ids containing every one of ``terms`` and a word starting with ``prefix``.
+
+        Only the ``expansions`` most common completions of the prefix are tried, and at most
+        ``budget`` documents per completion are scored, so a one-letter prefix stays cheap.
+        """
+        base = self.matching(terms) if terms else None
+        if base is not None and not base:
+            return []
+        words = self.trie.complete(prefix, expansions) if prefix else [None]
+        scorers = [self._scorer(t) for t in terms]
+        scores = {}
+        for word in words:
+            bucket, word_score = self._scorer(word) if word else ({}, None)
+            if base is None:
+                candidates = list(islice(bucket, budget))
+            elif word is None:
+                candidates = list(islice(base, budget))
+            elif len(base) < len(bucket):
+                candidates = [d for d in islice(base, budget) if d in bucket]
+            else:
+                candidates = [d for d in list(islice(bucket, budget)) if d in base]
+            for doc_id in candidates:
+                s = sum(score(doc_id) for _, score in scorers) + (word_score(doc_id) if word_score else 0.0)
+                if s > scores.get(doc_id, -1.0):
+                    scores[doc_id] = s
+        return [doc_id for _, doc_id in heapq.nlargest(limit, ((s, d) for d, s in scores.items()))]
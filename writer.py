@@ -0,0 +1,79 @@
+"""Single-writer queue that applies submitted operations in batches.
+
+Request threads ``submit()`` an operation and block until the writer thread
+has applied it. The writer drains everything pending into one batch and
+hands it to ``apply_batch``, so a burst of N requests costs one storage
+write rather than N, and the batch function never races with itself. An
+operation whose caller gave up waiting before the writer reached it is
+dropped, never applied behind the caller's back.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import record_time
+
+
+class Busy(Exception):
+    """The queue is full or the writer did not answer in time."""
+
+
+class BatchWriter:
+    def __init__(self, apply_batch, max_batch=500, max_pending=5000, timeout=10):
+        self.apply_batch = apply_batch
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue(max_pending)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # started lazily, and again in a forked worker, since threads don't survive fork()
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, op):
+        self._ensure_started()
+        fut = Future()
+        start = time.perf_counter()
+        try:
+            self._queue.put_nowait((op, fut))
+            return fut.result(self.timeout)
+        except queue.Full:
+            raise Busy()
+        except TimeoutError:
+            if fut.cancel():
+                raise Busy()
+            # the writer already has it in a batch, so it is moments from done
+            return fut.result()
+        finally:
+            # the storage work happens on the writer thread, so the caller only sees the wait
+            record_time('writer', time.perf_counter() - start)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [(op, fut) for op, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.apply_batch([op for op, _ in batch])
+            except Exception as exc:
+                for _, fut in batch:
+                    fut.set_exception(exc)
+            else:
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)